@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+ARTIFACT_ROOT = os.path.join(tempfile.gettempdir(), "jolly-joysticks-artifacts")
+
+
+class ArtifactStore:
+    """
+    Hands out a private path for every file a request produces (diagram sources and images,
+    solution documents) instead of the shared temp_diagram.* / solutions.docx names, and
+    deletes them once no chat entry references them anymore.
+    """
+
+    def __init__(self, root=ARTIFACT_ROOT):
+        self.root = root
+        self._owners = {}  # artifact dir -> set of chat entry ids still using it
+        self._entries = set()  # chat entry ids that have not been released yet
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def new_entry(self):
+        """Id for a chat entry, used as the owner of everything it produces."""
+        owner = uuid.uuid4().hex
+        with self._lock:
+            self._entries.add(owner)
+        return owner
+
+    def new_path(self, owner, name):
+        """Fresh path for an artifact called name (e.g. "diagram.png") owned by owner."""
+        directory = os.path.join(self.root, uuid.uuid4().hex)
+        with self._lock:
+            if owner not in self._entries:
+                # The chat entry was cleared while its request was still running
+                raise RuntimeError("Chat entry was removed")
+            # Created under the lock, so a release() of owner can't slip in between and leak it
+            os.makedirs(directory)
+            self._owners[directory] = {owner}
+        return os.path.join(directory, name)
+
+    def release(self, owner):
+        """Drop every reference held by owner and delete artifacts nobody uses anymore."""
+        with self._lock:
+            self._entries.discard(owner)
+            for owners in self._owners.values():
+                owners.discard(owner)
+        self.collect()
+
+    def collect(self):
+        with self._lock:
+            unused = [directory for directory, owners in self._owners.items() if not owners]
+            for directory in unused:
+                del self._owners[directory]
+        for directory in unused:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def collect_stale(self, older_than=24 * 3600):
+        """Remove untracked leftovers of earlier sessions (old enough not to belong to another running window)."""
+        with self._lock:
+            tracked = set(self._owners)
+        cutoff = time.time() - older_than
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            try:
+                if directory not in tracked and os.path.getmtime(directory) < cutoff:
+                    shutil.rmtree(directory, ignore_errors=True)
+            except OSError:
+                pass
+
+
+artifacts = ArtifactStore()
@@ -1,59 +1,124 @@
-import together
 import os
-import subprocess
 import tempfile
-from docx import Document
-from docx.shared import Pt
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
-import sys
-import docx
-import dotenv
-from concurrent.futures import ThreadPoolExecutor
-from PyPDF2 import PdfReader
+import hashlib
+import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from lazy import lazy_import
+from cache import cached, response_cache, CACHE_DIR, ResponseCache, MemoryTier, DiskTier
+from compiler import compile_cache, run_tests
+from sandbox import sandbox_pool
+from routing import router
+from compress import estimate_tokens
+
+# Document libraries are only imported once an assignment is actually solved
+docx = lazy_import("docx")
+docx_shared = lazy_import("docx.shared")
+docx_oxml = lazy_import("docx.oxml")
+docx_ns = lazy_import("docx.oxml.ns")
+PyPDF2 = lazy_import("PyPDF2")
 
 # Configuration
 TOGETHER_API_KEY = os.getenv("API_KEY_TOGETHER")  # Replace with your Together AI API key
 MODEL = 'together/gpt-neoxt-chat-20b'  # Replace with the Together AI model you want to use
+SOLUTION_MAX_TOKENS = 1500
+SOLUTION_TEMPERATURE = 0.2
+SOLUTION_SYSTEM_PROMPT = "I am an LLM trained to generate C code solutions."
+SOLUTION_CHAIN = router.routes["solution"]  # Models tried in order, the one that answered is kept with each solution
 TEMPDIR = tempfile.gettempdir()
-
-# Set Together AI client
-try:
-  client = together.Client(api_key=TOGETHER_API_KEY)
-except Exception as e:
-  print(f"Error initializing TogetherAI client: {e}")
-  client = None  # Set client to None to handle potential errors
-
-def read_questions_from_pdf(pdf_path):
+BATCH_MODE = False  # Pack several questions into one request, see generate_solutions_batch
+BATCH_TOKEN_BUDGET = 6000  # Prompt + expected reply tokens allowed in one batched request
+TOKENS_PER_SOLUTION = 500  # Expected reply size of a single solution
+BATCH_MAX_QUESTIONS = 10
+TEST_INPUTS = ["42\n", "0\n", "5 3\n"]  # Example stdin inputs each compiled solution is run against
+PDF_CHUNK_PAGES = 8  # Pages handed to one extraction process at a time
+PDF_PARALLEL_MIN_PAGES = 16  # Below this, spinning up processes costs more than it saves
+# Workers are never forked from the GUI process, a fork copies locks other threads may be holding
+PDF_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Extracted page text and parsed questions, keyed by the PDF's content hash
+pdf_cache = ResponseCache(
+    memory=MemoryTier(max_entries=16, ttl=24 * 3600),
+    disk=DiskTier(os.path.join(CACHE_DIR, "pdf_text.sqlite"), max_bytes=200 * 1024 * 1024, ttl=30 * 24 * 3600),
+)
+
+def pdf_content_hash(pdf_path):
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def extract_page_range(pdf_path, start, end):
+    """Runs in a worker process: extract the text of pages [start, end)."""
+    reader = PyPDF2.PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def iter_page_texts(pdf_path):
+    """Yield page texts in order, spreading extraction of large PDFs across a process pool."""
+    page_count = len(PyPDF2.PdfReader(pdf_path).pages)
+    if page_count < PDF_PARALLEL_MIN_PAGES:
+        yield from extract_page_range(pdf_path, 0, page_count)
+        return
+
+    starts = list(range(0, page_count, PDF_CHUNK_PAGES))
+    ends = [min(start + PDF_CHUNK_PAGES, page_count) for start in starts]
+    with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                             mp_context=multiprocessing.get_context(PDF_START_METHOD)) as executor:
+        # map keeps page order, so questions can still be numbered while later chunks extract
+        for texts in executor.map(extract_page_range, [pdf_path] * len(starts), starts, ends):
+            yield from texts
+
+def parse_questions(page_texts):
+    question_number = 1  # Initialize question number
+
+    # Iterate through each page in the PDF
+    for text in page_texts:
+        lines = text.split('\n')
+
+        for line in lines:
+            if line.strip().startswith(str(question_number) + "."):
+                # Extract the question text
+                question_text = line[len(str(question_number) + ". "):].strip()
+                yield question_text
+                question_number += 1  # Increment question number
+
+def iter_questions_from_pdf(pdf_path):
+    """Yield questions one at a time as each page is parsed, so later stages can start early."""
     try:
-        reader = PdfReader(pdf_path)
+        key = pdf_content_hash(pdf_path)
+        known = pdf_cache.get(key)
+        if known is not None:
+            yield from known["questions"]
+            return
+
+        pages = []
         questions = []
-        question_number = 1  # Initialize question number
 
-        # Iterate through each page in the PDF
-        for page in reader.pages:
-            text = page.extract_text()
-            lines = text.split('\n')
+        def remember(texts):
+            for text in texts:
+                pages.append(text)
+                yield text
 
-            for line in lines:
-                if line.strip().startswith(str(question_number) + "."):
-                    # Extract the question text
-                    question_text = line[len(str(question_number) + ". "):].strip()
-                    questions.append(question_text)
-                    question_number += 1  # Increment question number
+        for question in parse_questions(remember(iter_page_texts(pdf_path))):
+            questions.append(question)
+            yield question
 
-        return questions
+        # Only a fully read PDF goes into the cache
+        pdf_cache.set(key, {"pages": pages, "questions": questions})
 
     except Exception as e:
         print(f"Error reading PDF file: {e}")
-        return []
+
+def read_questions_from_pdf(pdf_path):
+    return list(iter_questions_from_pdf(pdf_path))
 
 
 
+@cached("solution", SOLUTION_CHAIN, SOLUTION_MAX_TOKENS, SOLUTION_TEMPERATURE)
 def generate_solution(question):
+    """{"solution": text, "model": "provider/model" that wrote it}, None if every model failed."""
     try:
-        # client = TogetherAIClient()  # Initialize TogetherAI client
-
         prompt = f"""
         You are an expert C programmer. Provide a clear and concise solution to the following programming problem, focusing on generating well-formatted C code, but no word extra other than the source code itself :
 
@@ -63,23 +128,80 @@ def generate_solution(question):
         Solution:
         """
 
-        response = client.chat.completions.create(
-            model="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",  # Replace with the appropriate model name
-            messages=[
-                {"role": "system", "content": "I am an LLM trained to generate C code solutions."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1500,
-            temperature=0.2,
-        )
-
-        solution = response.choices[0].message.content.strip()
-        return solution
+        # Paced and retried per model, and moved down the "solution" fallback chain when a model keeps failing
+        solution, model = router.answer("solution", prompt, cache=False, system=SOLUTION_SYSTEM_PROMPT,
+                                        max_tokens=SOLUTION_MAX_TOKENS, temperature=SOLUTION_TEMPERATURE)
+        return {"solution": solution.strip(), "model": model}
 
     except Exception as e:
         print(f"Error generating solution for question: {question}\nError: {e}")
         return None
 
+def pack_batches(items):
+    """
+    Group (idx, question) pairs into batches whose prompt plus expected replies fit in
+    BATCH_TOKEN_BUDGET, yielding each batch as soon as it is full.
+    """
+    batch = []
+    used = 0
+    for item in items:
+        cost = estimate_tokens(item[1]) + TOKENS_PER_SOLUTION
+        if batch and (used + cost > BATCH_TOKEN_BUDGET or len(batch) >= BATCH_MAX_QUESTIONS):
+            yield batch
+            batch = []
+            used = 0
+        batch.append(item)
+        used += cost
+    if batch:
+        yield batch
+
+def split_batch_reply(reply, count):
+    """Split a batched reply on its '### Solution <n>' markers, only keeping sections with code."""
+    sections = {}
+    parts = re.split(r'^\s*#{2,4}\s*Solution\s+(\d+)\s*:?\s*$', reply, flags=re.MULTILINE)
+    for number, body in zip(parts[1::2], parts[2::2]):
+        n = int(number)
+        body = body.strip()
+        if 1 <= n <= count and n not in sections and extract_code(body):
+            sections[n] = body
+    return sections
+
+def generate_solutions_batch(questions):
+    """
+    Solve several questions with one request. Returns a generate_solution result per question, in order;
+    anything missing from the reply or unparseable falls back to a single generate_solution call.
+    """
+    solutions = [response_cache.get(generate_solution.cache_key(question)) for question in questions]
+    missing = [i for i, solution in enumerate(solutions) if solution is None]
+
+    if len(missing) > 1:
+        problems = "\n\n".join(f"Problem {n}:\n{questions[i]}" for n, i in enumerate(missing, 1))
+        prompt = f"""
+        You are an expert C programmer. Solve each of the following programming problems.
+        For every problem write a line "### Solution <number>" using the problem's number, followed by
+        the complete C source in a ```c fenced block. No words other than these headings and the code.
+
+        {problems}
+        """
+        try:
+            reply, model = router.answer("solution", prompt, cache=False, system=SOLUTION_SYSTEM_PROMPT,
+                                         max_tokens=min(len(missing) * TOKENS_PER_SOLUTION * 2, BATCH_TOKEN_BUDGET),
+                                         temperature=SOLUTION_TEMPERATURE)
+            sections = split_batch_reply(reply, len(missing))
+        except Exception as e:
+            print(f"Error generating batch of {len(missing)} solutions, falling back to single requests\nError: {e}")
+            sections = {}
+
+        for n, i in enumerate(missing, 1):
+            if n in sections:
+                solutions[i] = {"solution": sections[n], "model": model}
+                # Same entry a single request would have filled, so reruns hit the cache
+                response_cache.set(generate_solution.cache_key(questions[i]), solutions[i])
+
+    # Fallback for whatever the batch did not deliver
+    return [solution if solution is not None else generate_solution(question)
+            for question, solution in zip(questions, solutions)]
+
 def extract_code(solution_text):
     import re
     code_pattern = re.compile(r'```c(.*?)```', re.DOTALL)
@@ -93,52 +215,31 @@ def extract_code(solution_text):
             return match.group(1).strip()
     return None
 
-def compile_and_run_c_code(c_code):
+def compile_and_run_c_code(c_code, test_inputs=None):
     """
-    Compiles and runs the provided C code.
-    Returns the output or error messages, simulating input if necessary.
+    Compiles (or reuses a cached build of) the provided C code and runs it against every test input.
+    Returns the first run's output or the compile error, with every run listed under "runs".
     """
-    simulated_input = "42\n"  # Example input; modify as needed for your programs.
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.c', dir=TEMPDIR) as c_file:
-        c_file_name = c_file.name
-        c_file.write(c_code.encode('utf-8'))
+    test_inputs = test_inputs or TEST_INPUTS
+    # gcc and the untrusted runs go through the bounded sandbox pool, not the LLM workers
+    build = sandbox_pool.run(compile_cache.compile, c_code)
+    if build["status"] != "success":
+        return build
 
-    exe_file = c_file_name.replace('.c', '.exe') if os.name == 'nt' else c_file_name.replace('.c', '')
+    runs = run_tests(build["binary"], test_inputs)
+    return {"status": runs[0]["status"], "message": runs[0]["message"], "runs": runs}
 
-    # Compile the C code
-    compile_cmd = ['gcc', c_file_name, '-o', exe_file]
-    try:
-        compile_process = subprocess.run(compile_cmd, capture_output=True, text=True, timeout=10)
-        if compile_process.returncode != 0:
-            os.unlink(c_file_name)
-            return {"status": "error", "message": f"Compilation failed:\n{compile_process.stderr}"}
-    except subprocess.TimeoutExpired:
-        os.unlink(c_file_name)
-        return {"status": "error", "message": "Compilation timed out during compilation."}
-
-    # Run the executable with simulated input
-    run_cmd = [exe_file]
-    try:
-        run_process = subprocess.run(run_cmd, capture_output=True, text=True, input=simulated_input, timeout=3)
-        output = run_process.stdout
-        if run_process.stderr:
-            output += f"\nRuntime Errors:\n{run_process.stderr}"
-        return {"status": "success", "message": output.strip()}
-    except subprocess.TimeoutExpired:
-        return {"status": "error", "message": "Execution timed out during runtime."}
-    except Exception as e:
-        return {"status": "error", "message": f"Error during execution: {e}"}
-    finally:
-        os.unlink(c_file_name)
-        if os.path.exists(exe_file):
-            os.unlink(exe_file)
-            
 
-def create_docx(qa_list, output_path):
-    document = Document()
-    document.add_heading('C Programming Solutions', 0)
+class DocxWriter:
+    """Builds the solutions document one question at a time."""
 
-    for idx, qa in enumerate(qa_list, 1):
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.document = docx.Document()
+        self.document.add_heading('C Programming Solutions', 0)
+
+    def add(self, idx, qa):
+        document = self.document
         question = qa['question']
         solution = qa['solution']
         output = qa['output']
@@ -157,46 +258,80 @@ def create_docx(qa_list, output_path):
             code_paragraph = document.add_paragraph()
             code_paragraph.style.font.name = 'Consolas'
             run = code_paragraph.add_run(code)
-            run.font.size = Pt(10)
+            run.font.size = docx_shared.Pt(10)
         else:
             document.add_paragraph(solution)
 
         # Add Output with Black Background and White Text
         document.add_heading('Output', level=2)
-        output_paragraph = document.add_paragraph()
+        runs = output.get('runs') if isinstance(output, dict) else None
+        if runs:
+            # One block per test input
+            for test_run in runs:
+                document.add_paragraph(f"Input: {test_run['input'].strip() or '(empty)'}  [{test_run['status']}]")
+                self.add_output_block(test_run['message'])
+        else:
+            self.add_output_block(output if isinstance(output, str) else output['message'])
+
+        document.add_page_break()
+
+    def add_output_block(self, text):
+        output_paragraph = self.document.add_paragraph()
         output_paragraph.style.font.name = 'Consolas'
-        run = output_paragraph.add_run(output if isinstance(output, str) else output['message'])
-        run.font.size = Pt(10)
-        run.font.color.rgb = docx.shared.RGBColor(255, 255, 255)  # Set font color to white
+        run = output_paragraph.add_run(text)
+        run.font.size = docx_shared.Pt(10)
+        run.font.color.rgb = docx_shared.RGBColor(255, 255, 255)  # Set font color to white
 
         # Set black background for the output text
         pPr = output_paragraph._element.get_or_add_pPr()  # Access paragraph properties
-        shading_elm = OxmlElement("w:shd")
-        shading_elm.set(qn("w:fill"), "000000")  # Set background to black
+        shading_elm = docx_oxml.OxmlElement("w:shd")
+        shading_elm.set(docx_ns.qn("w:fill"), "000000")  # Set background to black
         pPr.append(shading_elm)
 
-        document.add_page_break()
+    def save(self):
+        self.document.save(self.output_path)
+        print(f"Document saved to {self.output_path}")
 
-    document.save(output_path)
-    print(f"Document saved to {output_path}")
+def create_docx(qa_list, output_path):
+    writer = DocxWriter(output_path)
+    for idx, qa in enumerate(qa_list, 1):
+        writer.add(idx, qa)
+    writer.save()
 
 
 
-def process_question(question):
-    solution = generate_solution(question)
-    
+def solved_entry(question, result):
     # Check if solution is generated, otherwise return a message indicating failure
-    if not solution:
-        return {'question': question, 'solution': "Failed to generate solution.", 'output': "N/A"}
-    
+    if not result or not result['solution']:
+        return {'question': question, 'solution': "Failed to generate solution.", 'model': None, 'output': "N/A"}
+    return {'question': question, 'solution': result['solution'], 'model': result['model'], 'output': None}
+
+def solve_question(question):
+    """LLM half of process_question: returns the QA entry without output yet."""
+    return solved_entry(question, generate_solution(question))
+
+def solve_questions(questions):
+    """Batched solve_question, one request for the whole list."""
+    return [solved_entry(question, solution)
+            for question, solution in zip(questions, generate_solutions_batch(questions))]
+
+def run_solution(qa):
+    """Compile half of process_question: fills in the output of a solved QA entry."""
+    if qa['output'] is not None:
+        return qa
+
     # Extract code from solution
-    code = extract_code(solution)
+    code = extract_code(qa['solution'])
     if code:
         output = compile_and_run_c_code(code)
     else:
         output = "No executable code found in the solution."
 
-    return {'question': question, 'solution': solution, 'output': output}
+    return dict(qa, output=output)
+
+def process_question(question):
+    return run_solution(solve_question(question))
+
 # def main():
 #     if len(sys.argv) != 2:
 #         print("Usage: python generate_solutions.py questions.pdf")
@@ -0,0 +1,37 @@
+"""
+Prompt compression: time, tokens before and after, and a check that the prose of every
+compressed prompt fits the budget. Usage: python bench_compress.py [budget]
+"""
+import sys
+import time
+from compress import PROMPT_TOKEN_BUDGET, compress_prompt, estimate_tokens, split_segments
+
+FILLER = "the program should read the input carefully and handle every edge case that the grader might try"
+PROMPTS = {
+    "short": "Give me a code of star pattern in cpp",
+    "one long sentence": "Write a C program that sorts an array of integers, " + ", ".join([FILLER] * 40) + ".",
+    "unpunctuated": "write a program " + " ".join([FILLER] * 40),
+    "long sentence with code": "Fix this function so that " + " and ".join([FILLER] * 30) +
+                               "\n```c\nint main(void) { return 0; }\n```",
+    "many sentences": " ".join(f"Step {n}: {FILLER}." for n in range(60)) + " What is the time complexity?",
+}
+
+
+def main():
+    budget = int(sys.argv[1]) if len(sys.argv) > 1 else PROMPT_TOKEN_BUDGET
+    over = 0
+    for name, prompt in PROMPTS.items():
+        start = time.perf_counter()
+        compressed, report = compress_prompt(prompt, budget)
+        ms = (time.perf_counter() - start) * 1000
+        prose = sum(estimate_tokens(text) for text, is_code in split_segments(compressed) if not is_code)
+        fits = prose <= budget
+        over += not fits
+        print(f"{name:24} {ms:7.2f} ms  {report['tokens_before']:5} -> {report['tokens_after']:5} tokens, "
+              f"prose {prose}{'' if fits else '  OVER BUDGET'}")
+    if over:
+        sys.exit(f"{over} prompt(s) over the {budget} token budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Latency of the diagram backends on the locally parsed diagram types:
+Graphviz dot vs warm PlantUML pipe workers vs a cold plantuml run per diagram.
+Renders bypass the diagram cache. Usage: python bench_diagrams.py [runs]
+"""
+import statistics
+import subprocess
+import sys
+import time
+import dotrender
+from ones import local_dot, try_local_diagram
+from render import plantuml_command, render_service
+
+DESCRIPTIONS = [
+    "use case diagram: actors are customer and admin. The customer can browse products, order and pay. "
+    "The admin can manage products and view reports",
+    "flow diagram with steps: open the app, log in, if password is correct then show dashboard else show error, "
+    "select a product, pay, log out",
+]
+
+
+def cold_plantuml(source, fmt):
+    process = subprocess.run(plantuml_command() + ["-pipe", f"-t{fmt}"], input=source.encode("utf-8"),
+                             capture_output=True, check=True)
+    return process.stdout
+
+
+def measure(render, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(0.95 * (len(timings) - 1))]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    for description in DESCRIPTIONS:
+        dot_source = local_dot(description)
+        uml_source = try_local_diagram(description)
+        print(description[:60] + "...")
+        backends = []
+        if dotrender.available():
+            backends += [(f"graphviz {fmt}", lambda fmt=fmt: dotrender.render_dot(dot_source, fmt)) for fmt in ("png", "svg")]
+        else:
+            print("  graphviz: dot not found, skipped")
+        try:
+            plantuml_command()
+            backends.append(("plantuml warm png", lambda: render_service.render(uml_source, "png")))
+            backends.append(("plantuml cold png", lambda: cold_plantuml(uml_source, "png")))
+        except FileNotFoundError as e:
+            print(f"  plantuml: {e}, skipped")
+
+        for name, render in backends:
+            render()  # Warm up (starts the JVM for the warm workers)
+            median, p95 = measure(render, runs if "cold" not in name else max(3, runs // 5))
+            print(f"  {name:<20} median {median:8.1f} ms   p95 {p95:8.1f} ms")
+    render_service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
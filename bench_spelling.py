@@ -0,0 +1,64 @@
+"""
+Spelling correction speed: the memory mapped deletion index (spelling.py) against TextBlob.correct,
+on the same prompts, plus how often the two agree. Usage: python bench_spelling.py [repeats]
+"""
+import sys
+import time
+from spelling import INDEX_PATH, SpellIndex, build_index, dictionary_path, spell_index
+
+PROMPTS = [
+    "Give me a code of star patern in cpp",
+    "Pleese writte a C programm that reeds two numbres and prints there sum",
+    "Explane the diffrence between a stack and a queue with an exmaple",
+    "generate a use case diagram: actors are custmer and admin. The custmer can browse, order and pay",
+    "Solve the asignment questions and explian every step of the soluton in detial, the quesstions are "
+    "about sorting algoritms, linked lists and binary serch trees, and the answers should be writen in C",
+]
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    _, build_ms = timed(lambda: build_index(dictionary_path(), INDEX_PATH))
+    _, load_ms = timed(lambda: SpellIndex(INDEX_PATH))
+    print(f"Index build {build_ms:.0f} ms (once per machine), load {load_ms:.2f} ms")
+    index = spell_index()
+
+    try:
+        from textblob import TextBlob
+    except ImportError:
+        TextBlob = None
+        print("TextBlob not installed, only the index is measured")
+    if TextBlob is not None:
+        _, first_ms = timed(lambda: str(TextBlob("warm up").correct()))
+        print(f"TextBlob first call (loads its corpus) {first_ms:.0f} ms")
+
+    index_total = textblob_total = 0.0
+    agreed = words = 0
+    for prompt in PROMPTS:
+        corrected, index_ms = min((timed(lambda: index.correct(prompt)) for _ in range(repeats)), key=lambda run: run[1])
+        index_total += index_ms
+        print(f"\n{prompt[:70]}\n  index    {index_ms:8.2f} ms  {corrected[:70]}")
+        if TextBlob is not None:
+            expected, textblob_ms = min((timed(lambda: str(TextBlob(prompt).correct())) for _ in range(repeats)),
+                                        key=lambda run: run[1])
+            textblob_total += textblob_ms
+            print(f"  textblob {textblob_ms:8.2f} ms  {expected[:70]}")
+            pairs = list(zip(corrected.split(), expected.split()))
+            words += len(pairs)
+            agreed += sum(1 for ours, theirs in pairs if ours.strip(".,").lower() == theirs.strip(".,").lower())
+
+    batch, batch_ms = timed(lambda: index.correct_batch(PROMPTS * 20))
+    print(f"\nIndex total {index_total:.1f} ms, batch of {len(batch)} prompts {batch_ms:.1f} ms")
+    if TextBlob is not None:
+        print(f"TextBlob total {textblob_total:.1f} ms ({textblob_total / index_total:.0f}x), "
+              f"same word {agreed}/{words} times")
+
+
+if __name__ == "__main__":
+    main()
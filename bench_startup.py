@@ -0,0 +1,59 @@
+"""
+Startup import report: what importing the GUI costs per module, measured with python -X importtime
+in a fresh interpreter. Fails if a deferred library is imported eagerly again or the total goes over
+the budget. Usage: python bench_startup.py [budget ms]
+"""
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+STARTUP_BUDGET_MS = 1500
+# Must only load when their feature is first used (see lazy.py)
+DEFERRED = ["google.generativeai", "together", "textblob", "nltk", "PyPDF2", "docx", "tkinter", "requests",
+            "markdown", "pygments", "grpc"]
+TOP = 15
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure(module="mukul"):
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise SystemExit(process.stderr.strip().splitlines()[-1])
+    imports = []  # (module, self us, cumulative us, depth)
+    for line in process.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else STARTUP_BUDGET_MS
+    imports = measure()
+    total_ms = sum(self_us for _, self_us, _, _ in imports) / 1000
+
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in imports:
+        by_package[name.split(".")[0]] += self_us
+    print(f"Importing the GUI takes {total_ms:.0f} ms ({len(imports)} modules)")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:TOP]:
+        print(f"  {package:<30} {self_us / 1000:8.1f} ms")
+
+    names = {name for name, _, _, _ in imports}
+    eager = [module for module in DEFERRED if module in names]
+    failed = False
+    if eager:
+        print(f"Deferred libraries imported at startup: {', '.join(eager)}")
+        failed = True
+    if total_ms > budget:
+        print(f"Over the startup budget of {budget:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "jolly-joysticks")
+
+
+def make_key(*parts):
+    """Stable hash of everything that can change a reply (model, prompt, generation params)."""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """In-memory LRU tier with a per-entry TTL."""
+
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.time() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class DiskTier:
+    """SQLite backed tier, entries expire after the TTL and the least recently used go first once over max_bytes."""
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, expires_at REAL, accessed_at REAL)"
+        )
+        self._db.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        data = json.dumps(value)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now + self.ttl, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop the least recently used entries until we are back under the limit
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+
+
+class ResponseCache:
+    """
+    Two tier (memory LRU + disk) cache for model replies. Identical requests that are
+    in flight at the same time share a single upstream call.
+    """
+
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory or MemoryTier()
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # Callers that piggybacked on an in-flight request
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)  # Promote to the fast tier
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _join(self, key):
+        """(future, leader) for key, the first caller of an in-flight key is its leader."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = Future()
+                self._inflight[key] = future
+                return future, True
+            self.shared += 1
+            return future, False
+
+    def _finish(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def get_or_call(self, key, fn, should_cache=None):
+        value = self.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+
+        self._count("misses")
+        try:
+            value = fn()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            if value is not None and (should_cache is None or should_cache(value)):
+                self.set(key, value)
+            return value
+        finally:
+            self._finish(key)
+
+    def stream_or_call(self, key, fn):
+        """
+        Streaming get_or_call(): a hit is yielded as one chunk, the leader streams fn() and stores
+        the joined text, identical streams started meanwhile wait for that text and get it as one chunk.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self._count("hits")
+                yield value
+                return
+            future, leader = self._join(key)
+            if leader:
+                break
+            value = future.result()
+            if value is not None:
+                yield value
+                return
+            # The leader's reader stopped early or nothing came back, ask again
+
+        self._count("misses")
+        pieces = []
+        finished = False
+        try:
+            for piece in fn():
+                pieces.append(piece)
+                yield piece
+            finished = True
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._finish(key)
+            if not future.done():
+                future.set_result("".join(pieces) if finished and pieces else None)
+            if finished and pieces:
+                self.set(key, "".join(pieces))
+
+    def stats(self):
+        with self._lock:
+            hits, misses, shared = self.hits, self.misses, self.shared
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "shared_inflight": shared,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+def cached(namespace, *key_parts, should_cache=None):
+    """
+    Decorator that puts a model call behind the shared response cache.
+    namespace and key_parts (model name, generation params) go into the key along with the call arguments.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = make_key(namespace, key_parts, args, kwargs)
+            return response_cache.get_or_call(key, lambda: fn(*args, **kwargs), should_cache)
+        wrapper.uncached = fn
+        # Lets other code paths (e.g. batched generation) read and fill the same entries
+        wrapper.cache_key = lambda *args, **kwargs: make_key(namespace, key_parts, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def cached_stream(namespace, *key_parts):
+    """
+    Streaming counterpart of cached(). A hit is yielded as a single chunk, a miss streams
+    from upstream and stores the joined text once the stream finishes. Identical streams
+    in flight at the same time share the upstream call.
+    Uses the same key as cached() so blocking and streaming calls share entries.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = make_key(namespace, key_parts, args, kwargs)
+            return response_cache.stream_or_call(key, lambda: fn(*args, **kwargs))
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+
+# Shared cache used by final.py and auto.py
+response_cache = ResponseCache(disk=DiskTier(os.path.join(CACHE_DIR, "responses.sqlite")))
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from cache import CACHE_DIR
+from sandbox import sandbox_pool, limited, RUN_CPU_SECONDS, RUN_MEMORY_MB, RUN_FILE_MB, COMPILE_CPU_SECONDS, \
+    COMPILE_MEMORY_MB, COMPILE_FILE_MB
+
+COMPILER = "gcc"
+COMPILE_FLAGS = []
+EXE_SUFFIX = ".exe" if os.name == "nt" else ""
+
+
+class CompileCache:
+    """
+    Content-addressed store of built binaries. The key is a hash of the compiler, flags and
+    source, so the same code is only ever compiled once. The least recently used binaries
+    are evicted once the store holds more than max_entries.
+    """
+
+    def __init__(self, directory, max_entries=200):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._building = {}  # key -> lock, so two threads never build the same binary
+        self.scratch = os.path.join(sandbox_pool.scratch_dir, "build")  # Sources and half built binaries, on tmpfs
+        os.makedirs(self.directory, exist_ok=True)
+        os.makedirs(self.scratch, exist_ok=True)
+
+    def key(self, source, flags):
+        raw = "\0".join([COMPILER] + list(flags) + [source])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def binary_path(self, key):
+        return os.path.join(self.directory, key + EXE_SUFFIX)
+
+    def compile(self, source, flags=None):
+        """Return {"status": "success", "binary": path} or {"status": "error", "message": ...}."""
+        flags = COMPILE_FLAGS if flags is None else flags
+        key = self.key(source, flags)
+        binary = self.binary_path(key)
+
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            if os.path.exists(binary):
+                self.hits += 1
+                os.utime(binary)  # Mark as recently used for LRU eviction
+                return {"status": "success", "binary": binary}
+            self.misses += 1
+            result = self._build(source, flags, binary)
+        with self._lock:
+            self._building.pop(key, None)
+        if result["status"] == "success":
+            self.evict()
+        return result
+
+    def _build(self, source, flags, binary):
+        # Every build gets its own directory in the scratch dir, and the binary is moved out of it
+        # once complete, so a half written binary is never picked up
+        with tempfile.TemporaryDirectory(dir=self.scratch) as workdir:
+            c_file_name = os.path.join(workdir, "solution.c")
+            with open(c_file_name, "w", encoding="utf-8") as c_file:
+                c_file.write(source)
+            partial = os.path.join(workdir, "solution" + EXE_SUFFIX)
+            try:
+                compile_process = subprocess.run(
+                    limited([COMPILER, c_file_name, *flags, '-o', partial],
+                            COMPILE_CPU_SECONDS, COMPILE_MEMORY_MB, COMPILE_FILE_MB),
+                    capture_output=True, text=True, timeout=10, cwd=workdir)
+            except subprocess.TimeoutExpired:
+                return {"status": "error", "message": "Compilation timed out during compilation."}
+            if compile_process.returncode != 0:
+                return {"status": "error", "message": f"Compilation failed:\n{compile_process.stderr}"}
+            # The scratch dir may be on another filesystem (tmpfs), so copy then rename atomically
+            staged = binary + ".partial"
+            shutil.copy2(partial, staged)
+            os.replace(staged, binary)
+            return {"status": "success", "binary": binary}
+
+    def evict(self):
+        with self._lock:
+            binaries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+            binaries = [path for path in binaries if os.path.isfile(path) and not path.endswith(".partial")]
+            if len(binaries) <= self.max_entries:
+                return
+            binaries.sort(key=lambda path: os.path.getmtime(path))
+            for path in binaries[:len(binaries) - self.max_entries]:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass  # Still running somewhere or already gone
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+def run_binary(binary, test_input, timeout=3):
+    """Run a built binary once against a single stdin input, under the sandbox limits and in its own directory."""
+    try:
+        with tempfile.TemporaryDirectory(dir=sandbox_pool.scratch_dir) as workdir:
+            run_process = subprocess.run(limited([binary], RUN_CPU_SECONDS, RUN_MEMORY_MB, RUN_FILE_MB),
+                                         capture_output=True, text=True, input=test_input, timeout=timeout,
+                                         cwd=workdir)
+        output = run_process.stdout
+        if run_process.stderr:
+            output += f"\nRuntime Errors:\n{run_process.stderr}"
+        if run_process.returncode < 0:
+            output += f"\nKilled by signal {-run_process.returncode} (CPU, memory or file size limit reached?)"
+        status = "error" if run_process.returncode < 0 else "success"
+        return {"input": test_input, "status": status, "message": output.strip()}
+    except subprocess.TimeoutExpired:
+        return {"input": test_input, "status": "error", "message": "Execution timed out during runtime."}
+    except Exception as e:
+        return {"input": test_input, "status": "error", "message": f"Error during execution: {e}"}
+
+
+def run_tests(binary, test_inputs):
+    """Run one binary against every input in parallel on the sandbox pool, results come back in input order."""
+    return sandbox_pool.map(lambda test_input: run_binary(binary, test_input), test_inputs)
+
+
+compile_cache = CompileCache(os.path.join(CACHE_DIR, "binaries"))
@@ -0,0 +1,144 @@
+import math
+import re
+
+PROMPT_TOKEN_BUDGET = 400  # Prose tokens a prompt is cut down to, code blocks come on top
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_ITERATIONS = 30
+FIRST_SENTENCE_BOOST = 1.5  # The opening sentence usually carries the actual request
+QUESTION_BOOST = 1.3
+ENTITY_BOOST = 0.15  # Per named entity in the sentence
+
+CODE_BLOCK = re.compile(r"```.*?(?:```|$)", re.DOTALL)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[`])|\n\s*\n|\n(?=\s*(?:[-*]|\d+[.)])\s)")
+WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_']*|\d+")
+# Names, numbers, quoted text, inline code and identifiers, the parts a summary must not lose
+ENTITY = re.compile(r"`[^`\n]+`|\"[^\"\n]+\"|\b\d[\d.,:/-]*\b|\b[A-Za-z]+_\w+|\b[a-z]+[A-Z]\w*|"
+                    r"(?<=\w )[A-Z][A-Za-z0-9]+(?: [A-Z][A-Za-z0-9]+)*")
+STOPWORDS = set("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+out over own same she should so some such than that the their them then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you your
+""".split())
+
+
+def estimate_tokens(text):
+    # Rough count, ~4 characters per token for English and C
+    return len(text) // 4 + 1
+
+
+def split_segments(text):
+    """(text, is code) pieces of a prompt in order, prose split into sentences."""
+    segments = []
+    position = 0
+    for code in CODE_BLOCK.finditer(text):
+        segments += [(sentence, False) for sentence in split_sentences(text[position:code.start()])]
+        segments.append((code.group(), True))
+        position = code.end()
+    segments += [(sentence, False) for sentence in split_sentences(text[position:])]
+    return segments
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_END.split(text) if sentence.strip()]
+
+
+def truncate(sentence, budget):
+    """Start of sentence that fits in budget tokens, cut at a word boundary."""
+    if estimate_tokens(sentence) <= budget:
+        return sentence
+    limit = max(budget - 2, 0) * 4  # Leaves room for the " ..." marker
+    cut = sentence[:limit].rsplit(None, 1)[0] if " " in sentence[:limit] else sentence[:limit]
+    return cut.rstrip(" ,;:") + " ..."
+
+
+def textrank(word_sets):
+    """TextRank scores of sentences given as sets of content words, similarity as in the original paper."""
+    count = len(word_sets)
+    by_word = {}
+    for i, words in enumerate(word_sets):
+        for word in words:
+            by_word.setdefault(word, []).append(i)
+
+    # Only sentences that share a word are linked, so this stays far below n^2 on real prompts
+    links = [{} for _ in range(count)]
+    for sentences in by_word.values():
+        for n, i in enumerate(sentences):
+            for j in sentences[n + 1:]:
+                links[i][j] = links[i].get(j, 0) + 1
+                links[j][i] = links[j].get(i, 0) + 1
+    for i in range(count):
+        for j, overlap in links[i].items():
+            norm = math.log(len(word_sets[i]) + 1) + math.log(len(word_sets[j]) + 1)
+            links[i][j] = overlap / norm
+    totals = [sum(weights.values()) for weights in links]
+
+    scores = [1.0] * count
+    for _ in range(TEXTRANK_ITERATIONS):
+        scores = [(1 - TEXTRANK_DAMPING) + TEXTRANK_DAMPING * sum(scores[j] * weight / totals[j]
+                                                                  for j, weight in links[i].items())
+                  for i in range(count)]
+    return scores
+
+
+def compress_prompt(text, budget=PROMPT_TOKEN_BUDGET):
+    """
+    Extractive compression: keep the highest ranked sentences of the prose that fit in budget
+    tokens, in their original order. Code blocks are always kept verbatim, and sentences that
+    mention a named entity no kept sentence covers yet go before the rest. The best sentence is
+    always kept, truncated if it alone is over budget, so a single long sentence or unpunctuated
+    prompt is cut down as well. Returns (text, report).
+    """
+    before = estimate_tokens(text)
+    segments = split_segments(text)
+    prose = [i for i, (_, is_code) in enumerate(segments) if not is_code]
+    prose_tokens = sum(estimate_tokens(segments[i][0]) for i in prose)
+    if prose_tokens <= budget:
+        return text, {"tokens_before": before, "tokens_after": before, "tokens_saved": 0}
+
+    word_sets = [{word.lower() for word in WORD.findall(segments[i][0])} - STOPWORDS for i in prose]
+    entities = [set(ENTITY.findall(segments[i][0])) for i in prose]
+    scores = textrank(word_sets)
+    for n, i in enumerate(prose):
+        sentence = segments[i][0]
+        if n == 0:
+            scores[n] *= FIRST_SENTENCE_BOOST
+        if sentence.endswith("?"):
+            scores[n] *= QUESTION_BOOST
+        scores[n] *= 1 + ENTITY_BOOST * len(entities[n])
+
+    kept = set()
+    used = 0
+    covered = set()
+    ranked = sorted(range(len(prose)), key=lambda n: -scores[n])
+    # Best sentence first, then sentences that mention a named entity not covered yet, then the rest by rank
+    passes = [ranked[:1], ranked, ranked]
+    for number, candidates in enumerate(passes):
+        for n in candidates:
+            if n in kept or (number == 1 and not entities[n] - covered):
+                continue
+            size = estimate_tokens(segments[prose[n]][0])
+            if used + size <= budget:
+                kept.add(n)
+                used += size
+                covered |= entities[n]
+
+    shortened = {}
+    if not kept:
+        # Every sentence (or the only one) is over budget on its own, keep the start of the best one rather than nothing
+        kept.add(ranked[0])
+        shortened[prose[ranked[0]]] = truncate(segments[prose[ranked[0]]][0], budget)
+
+    keep = {prose[n] for n in kept} | {i for i, (_, is_code) in enumerate(segments) if is_code}
+    compressed = ""
+    for i in sorted(keep):
+        sentence, is_code = segments[i]
+        sentence = shortened.get(i, sentence)
+        if compressed:
+            compressed += "\n" if is_code or compressed.endswith("```") else " "
+        compressed += sentence
+    after = estimate_tokens(compressed)
+    if not compressed.strip() or after >= before:
+        return text, {"tokens_before": before, "tokens_after": before, "tokens_saved": 0}
+    return compressed, {"tokens_before": before, "tokens_after": after, "tokens_saved": max(before - after, 0)}
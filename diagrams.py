@@ -0,0 +1,114 @@
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from hedge import Side, close_quietly, run_as
+from render import normalize_uml
+
+SPECULATIVE_CANDIDATES = 3  # UML programs requested at once, 1 turns speculation off
+MAX_UNKNOWN_RATIO = 0.2  # Share of unrecognised lines tolerated before a candidate counts as prose
+
+# Statement shapes PlantUML accepts in the diagram types we ask for
+STATEMENT_PATTERNS = [
+    r"(left to right|top to bottom) direction",
+    r"(actor|usecase|class|interface|enum|abstract|abstract class|participant|boundary|control|entity|database|"
+    r"collections|queue|rectangle|package|node|component|folder|frame|cloud|object|state|artifact|card|storage|"
+    r"agent|file|stack|partition|namespace)\b.*",
+    r".*\S\s*(-+|\.\.+|-\[[^\]]*\]-*)(>|\|>)\s*\S.*",  # Arrows: ->, -->, ..>, --|>, -[#red]->
+    r".*\S\s*(<|<\|)(-+|\.\.+)\s*\S.*",  # Reversed arrows: <-, <|--
+    r".*\S\s*(--+|\.\.+|==+)\s*\S.*",  # Plain links: A -- B, A .. B
+    r"(start|stop|end|kill|detach|fork|fork again|end fork|end merge|split|split again|end split|"
+    r"repeat|backward|break|else|endif|endwhile|end group|end box|end note|endlegend|end title|"
+    r"endheader|endfooter|activate|deactivate|destroy|return|autonumber|newpage|hide|show|remove)\b.*",
+    r"(if|elseif|while|repeat while|switch|case|endswitch|alt|opt|loop|par|critical|group|box|ref|note|"
+    r"legend|title|header|footer|caption|skinparam|skin|scale|!\w+|together|mainframe)\b.*",
+    r":.*;?",  # Activity steps, possibly spanning lines
+    r"\(.*\)( as .*)?",  # (Use case) as UC1
+    r"\[.*\]( as .*)?",  # [Component]
+    r"\|.*\|.*",  # Swimlanes
+    r"(==|\.\.\.|\|\|\|).*",  # Separators and delays
+    r"[{}].*|.*[{}]",
+    r"[-+#~]\s*\w.*",  # Class members with visibility: +name: String, -id : int, +login()
+    r"\w[\w<>\[\],.]*\s*\(.*\)(\s*:.*)?",  # Methods without visibility: login(), area(): double
+    r"\w[\w<>\[\],.]*\s+\w+(\s*=.*)?;?",  # Typed fields: String email, int age = 0
+    r"(--+|\.\.+|__+)(.*\S)?",  # Class body separators, optionally titled: --, .. private ..
+    r"\w[\w .]*\s*:.*",  # Field or member lines, messages with labels
+]
+STATEMENT_RE = re.compile("|".join(f"(?:{pattern})" for pattern in STATEMENT_PATTERNS), re.IGNORECASE)
+
+
+def validate_uml(source):
+    """
+    Fast local check of LLM produced UML, no PlantUML involved.
+    Returns (normalized source, None) when it looks renderable, otherwise (None, reason).
+    """
+    if re.search(r"^\s*(graph|flowchart)\s+(TD|TB|LR|RL|BT)\b|^\s*sequenceDiagram\b", source, re.MULTILINE | re.IGNORECASE):
+        return None, "Mermaid, not PlantUML"
+    if "@startuml" not in source or "@enduml" not in source:
+        return None, "missing @startuml/@enduml"
+
+    normalized = normalize_uml(source)
+    statements = normalized.split("\n")[1:-1]
+    if not statements:
+        return None, "empty diagram"
+    if normalized.count("{") != normalized.count("}"):
+        return None, "unbalanced braces"
+
+    lowered = [line.lower() for line in statements]
+    opened = sum(1 for line in lowered if re.match(r"if\s*\(", line))
+    closed = sum(1 for line in lowered if line.startswith(("endif", "end if")))
+    if opened != closed:
+        return None, "unbalanced if/endif"
+
+    unknown = [line for line in statements if not STATEMENT_RE.fullmatch(line)]
+    if len(unknown) > MAX_UNKNOWN_RATIO * len(statements):
+        return None, f"unrecognised lines, e.g. {unknown[0][:60]!r}"
+    return normalized, None
+
+
+def speculative_uml(generate, prompt, candidates=SPECULATIVE_CANDIDATES):
+    """
+    Ask for several UML programs at once and return the first one that passes validate_uml.
+    generate(prompt) must return a fresh (uncached, sampled) chunk iterator. Once a candidate
+    validates the others lose: their responses are closed where the stream registered a closer
+    with hedge.on_close, and their readers stop at the next chunk.
+    If none is valid the first reply is returned so the caller still gets PlantUML's error image.
+    """
+    if candidates <= 1:
+        return "".join(generate(prompt))
+
+    sides = [Side() for _ in range(candidates)]
+
+    def read(side):
+        chunks = iter(generate(prompt))
+        pieces = []
+        try:
+            for chunk in chunks:
+                if side.lost:
+                    break
+                pieces.append(chunk)
+        finally:
+            close_quietly(chunks.close)
+        return "".join(pieces)
+
+    executor = ThreadPoolExecutor(max_workers=candidates)
+    futures = {executor.submit(run_as, side, read, side): side for side in sides}
+    first = None
+    try:
+        for future in as_completed(futures):
+            try:
+                reply = future.result()
+            except Exception as e:
+                print(f"UML candidate failed: {e}")
+                continue
+            if first is None:
+                first = reply
+            normalized, reason = validate_uml(reply)
+            if normalized is not None:
+                return normalized
+            print(f"Rejected UML candidate: {reason}")
+    finally:
+        for side in sides:
+            side.lose()
+        executor.shutdown(wait=False)
+    if first is None:
+        raise RuntimeError("Every UML candidate failed")
+    return first
@@ -0,0 +1,124 @@
+import re
+import shutil
+import subprocess
+
+DOT_TIMEOUT = 10
+
+
+def available():
+    return shutil.which("dot") is not None
+
+
+def quote(text):
+    return '"' + str(text).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def use_case_dot(actors, use_cases, links):
+    """DOT for the structures ones.parse_use_case returns."""
+    lines = [
+        "digraph G {",
+        "  rankdir=LR;",
+        '  node [fontname="Helvetica"];',
+        "  subgraph cluster_system {",
+        '    label="System"; style=rounded;',
+    ]
+    lines += [f"    UC{n} [label={quote(use_case)}, shape=ellipse];" for n, use_case in enumerate(use_cases, 1)]
+    lines.append("  }")
+    lines += [f"  A{n} [label={quote(actor)}, shape=box, style=rounded];" for n, actor in enumerate(actors, 1)]
+    actor_ids = {actor: f"A{n}" for n, actor in enumerate(actors, 1)}
+    use_case_ids = {use_case: f"UC{n}" for n, use_case in enumerate(use_cases, 1)}
+    lines += [f"  {actor_ids[actor]} -> {use_case_ids[use_case]} [arrowhead=none];" for actor, use_case in links]
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def flow_dot(steps):
+    """DOT for the step lists ones.parse_flow returns, decisions become diamonds."""
+    lines = [
+        "digraph G {",
+        '  node [fontname="Helvetica", shape=box, style=rounded];',
+        "  start [label=\"\", shape=circle, style=filled, fillcolor=black, width=0.25];",
+    ]
+    previous = ["start"]  # Nodes whose outgoing edge still has to be connected
+    for n, step in enumerate(steps, 1):
+        if isinstance(step, tuple):
+            condition, yes, no = step
+            lines.append(f"  D{n} [label={quote(condition + '?')}, shape=diamond, style=\"\"];")
+            lines += [f"  {node} -> D{n};" for node in previous]
+            lines.append(f"  Y{n} [label={quote(yes)}];")
+            lines.append(f'  D{n} -> Y{n} [label="yes"];')
+            previous = [f"Y{n}"]
+            if no:
+                lines.append(f"  N{n} [label={quote(no)}];")
+                lines.append(f'  D{n} -> N{n} [label="no"];')
+                previous.append(f"N{n}")
+            else:
+                previous.append(f'D{n}:e')
+        else:
+            lines.append(f"  S{n} [label={quote(step)}];")
+            lines += [f"  {node} -> S{n};" for node in previous]
+            previous = [f"S{n}"]
+    lines.append('  stop [label="", shape=doublecircle, style=filled, fillcolor=black, width=0.2];')
+    lines += [f"  {node} -> stop;" for node in previous]
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+MERMAID_NODE = re.compile(r"(\w+)\s*(?:\[([^\]]*)\]|\(([^)]*)\)|\{([^}]*)\})?")
+MERMAID_EDGE = re.compile(r"\s*(-->|---|-\.->|==>)\s*(?:\|([^|]*)\|)?\s*")
+
+
+def mermaid_dot(source):
+    """
+    DOT for Mermaid style flowcharts ("graph LR" with A[Label] --> B{Decision} edges, as
+    in one.txt). Returns None if the text is not such a flowchart.
+    """
+    header = re.search(r"^\s*(?:graph|flowchart)\s+(TD|TB|LR|RL|BT)\b", source, re.MULTILINE | re.IGNORECASE)
+    if not header:
+        return None
+    direction = {"TD": "TB"}.get(header.group(1).upper(), header.group(1).upper())
+    labels = {}
+    shapes = {}
+    edges = []
+    for line in source[header.end():].split("\n"):
+        line = line.strip()
+        if line.startswith("```") or re.match(r"(graph|flowchart)\s", line, re.IGNORECASE):
+            break  # Only the first diagram of a reply
+        if not line or line.startswith("%%"):
+            continue
+        parts = MERMAID_EDGE.split(line)
+        # parts alternates node, arrow, edge label, node, ...
+        nodes = []
+        for text in parts[0::3]:
+            match = MERMAID_NODE.match(text.strip())
+            if not match:
+                break
+            node, square, round_, curly = match.groups()
+            label = square or round_ or curly
+            if label is not None:
+                labels[node] = label
+                shapes[node] = "diamond" if curly is not None else "box"
+            labels.setdefault(node, node)
+            nodes.append(node)
+        edge_labels = parts[2::3]
+        for n in range(len(nodes) - 1):
+            edges.append((nodes[n], nodes[n + 1], edge_labels[n] if n < len(edge_labels) else None))
+
+    if not edges:
+        return None
+    lines = ["digraph G {", f"  rankdir={direction};", '  node [fontname="Helvetica", shape=box, style=rounded];']
+    # Node ids are quoted too, Mermaid ids may clash with DOT keywords such as node or edge
+    lines += [f"  {quote(node)} [label={quote(label)}, shape={shapes.get(node, 'box')}];" for node, label in labels.items()]
+    for head, tail, label in edges:
+        lines.append(f"  {quote(head)} -> {quote(tail)}" + (f" [label={quote(label)}];" if label else ";"))
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def render_dot(dot_source, fmt="svg"):
+    """Lay out and render DOT with the Graphviz binary, returns the image bytes."""
+    process = subprocess.run(["dot", f"-T{fmt}"], input=dot_source.encode("utf-8"),
+                             capture_output=True, timeout=DOT_TIMEOUT)
+    if process.returncode != 0:
+        raise RuntimeError(f"Graphviz failed: {process.stderr.decode('utf-8', 'replace')}")
+    return process.stdout
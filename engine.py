@@ -0,0 +1,165 @@
+import itertools
+import threading
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+
+class WorkerSignals(QObject):
+    """Signals a background job uses to report back to the GUI thread."""
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    chunk = pyqtSignal(int, object)
+
+
+class Job(QRunnable):
+    """Runs one backend call on a QThreadPool thread."""
+
+    def __init__(self, request_id, fn, args, kwargs, cancelled, signals, stream=False):
+        super().__init__()
+        self.request_id = request_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = cancelled
+        self.signals = signals
+        self.stream = stream
+
+    def run(self):
+        # Skip jobs that were cancelled while still waiting in the queue
+        if self.cancelled.is_set():
+            return
+        try:
+            if self.stream:
+                result = self.consume(self.fn(*self.args, **self.kwargs))
+            else:
+                result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self.signals.failed.emit(self.request_id, str(e))
+            return
+        if not self.cancelled.is_set():
+            self.signals.finished.emit(self.request_id, result)
+
+    def consume(self, chunks):
+        # Forward every chunk as it arrives and stop reading once cancelled
+        pieces = []
+        for piece in chunks:
+            if self.cancelled.is_set():
+                break
+            if piece:
+                pieces.append(piece)
+                self.signals.chunk.emit(self.request_id, piece)
+        return "".join(pieces)
+
+
+class RequestEngine(QObject):
+    """
+    Runs backend calls (LLMs, PDF pipeline, PlantUML) off the GUI thread.
+    Results are delivered back on the GUI thread through the callbacks given to submit().
+    """
+    busy_changed = pyqtSignal(bool)
+
+    def __init__(self, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        else:
+            self.pool.setMaxThreadCount(max(4, QThreadPool.globalInstance().maxThreadCount()))
+
+        self.signals = WorkerSignals()
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+        self.signals.chunk.connect(self._on_chunk)
+
+        self._ids = itertools.count(1)
+        self._pending = {}  # request_id -> (cancel event, on_result, on_error)
+        self._chunk_handlers = {}  # request_id -> on_chunk, streaming requests only
+
+    def submit(self, fn, *args, on_result=None, on_error=None, on_progress=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs) on the pool and return its request id.
+        With on_progress, fn is also called with progress= (a callable whose events reach
+        on_progress on the GUI thread) and cancelled= (a threading.Event set on cancel).
+        """
+        return self._start(fn, args, kwargs, on_result, on_error, on_progress=on_progress)
+
+    def submit_stream(self, fn, *args, on_chunk=None, on_result=None, on_error=None, **kwargs):
+        """
+        Queue a generator function, on_chunk gets every piece it yields on the GUI thread
+        and on_result gets the joined text once the stream ends.
+        """
+        return self._start(fn, args, kwargs, on_result, on_error, on_chunk)
+
+    def _start(self, fn, args, kwargs, on_result, on_error, on_chunk=None, on_progress=None):
+        request_id = next(self._ids)
+        cancelled = threading.Event()
+        self._pending[request_id] = (cancelled, on_result, on_error)
+        stream = on_chunk is not None
+        if on_chunk:
+            self._chunk_handlers[request_id] = on_chunk
+        if on_progress:
+            # Progress events travel on the chunk signal, the job itself is not a stream
+            self._chunk_handlers[request_id] = on_progress
+            kwargs = dict(kwargs, cancelled=cancelled,
+                          progress=lambda event: self.signals.chunk.emit(request_id, event))
+        self.pool.start(Job(request_id, fn, args, kwargs, cancelled, self.signals, stream))
+        if len(self._pending) == 1:
+            self.busy_changed.emit(True)
+        return request_id
+
+    def cancel(self, request_id):
+        """Drop a single request; its result will never be delivered."""
+        entry = self._pending.pop(request_id, None)
+        self._chunk_handlers.pop(request_id, None)
+        if entry:
+            entry[0].set()
+            if not self._pending:
+                self.busy_changed.emit(False)
+
+    def cancel_all(self):
+        """Drop every in-flight request and clear anything still queued."""
+        for cancelled, _, _ in self._pending.values():
+            cancelled.set()
+        had_pending = bool(self._pending)
+        self._pending.clear()
+        self._chunk_handlers.clear()
+        self.pool.clear()
+        if had_pending:
+            self.busy_changed.emit(False)
+
+    def is_cancelled(self, request_id):
+        entry = self._pending.get(request_id)
+        return entry is None or entry[0].is_set()
+
+    def in_flight(self):
+        return len(self._pending)
+
+    @pyqtSlot(int, object)
+    def _on_chunk(self, request_id, piece):
+        on_chunk = self._chunk_handlers.get(request_id)
+        if on_chunk:
+            on_chunk(piece)
+
+    @pyqtSlot(int, object)
+    def _on_finished(self, request_id, result):
+        self._chunk_handlers.pop(request_id, None)
+        entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return
+        if entry[1]:
+            entry[1](result)
+        # The callback may have queued follow-up work, so check afterwards
+        if not self._pending:
+            self.busy_changed.emit(False)
+
+    @pyqtSlot(int, str)
+    def _on_failed(self, request_id, message):
+        self._chunk_handlers.pop(request_id, None)
+        entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return
+        if entry[2]:
+            entry[2](message)
+        # The callback may have queued follow-up work, so check afterwards
+        if not self._pending:
+            self.busy_changed.emit(False)
@@ -1,12 +1,16 @@
-import requests
-import google.generativeai as genai
-from textblob import TextBlob
 from dotenv import load_dotenv
 import os
-import together
-from tkinter import Tk
-from tkinter.filedialog import asksaveasfilename
-from tkinter.filedialog import askopenfilename
+from lazy import lazy_import
+from providers import registry
+from cache import cached
+from scheduler import scheduler, ProviderError, RETRYABLE_STATUS
+from spelling import spell_index
+from compress import compress_prompt, PROMPT_TOKEN_BUDGET
+from routing import router
+
+# Imported the first time a file dialog is used
+tkinter = lazy_import("tkinter")
+filedialog = lazy_import("tkinter.filedialog")
 
 load_dotenv()   
 
@@ -16,9 +20,17 @@ API_KEY_GEMINI = os.getenv("API_KEY_GEMINI")
 API_KEY_TOGETHER = os.getenv("API_KEY_TOGETHER")
 
 
-# Function to simplify and enhance the input
-def simplify_prompt(user_input):
-    headers = {"Authorization": f"Bearer {API_KEY_HUGGING_FACE}"}
+# Function to simplify the input: local extractive compression to a token budget, no network round trip
+def simplify_prompt(user_input, budget=PROMPT_TOKEN_BUDGET):
+    compressed, report = compress_prompt(user_input, budget)
+    if report["tokens_saved"]:
+        print(f"Prompt compressed from {report['tokens_before']} to {report['tokens_after']} tokens "
+              f"({report['tokens_saved']} saved)")
+    return compressed
+
+# Abstractive summary from the hosted BART model, much slower than simplify_prompt
+@cached("huggingface", API_URL_HUGGING_FACE, 100, 20, should_cache=lambda result: not result.startswith("Error:"))
+def summarize_remote(user_input):
     payload = {
         "inputs": user_input,
         "parameters": {
@@ -28,25 +40,27 @@ def simplify_prompt(user_input):
         }
     }
 
-    response = requests.post(API_URL_HUGGING_FACE, headers=headers, json=payload)
+    def post():
+        # Pooled keep-alive session, the auth header is set on it once
+        response = registry.http_session().post(API_URL_HUGGING_FACE, json=payload)
+        if response.status_code in RETRYABLE_STATUS:
+            # 429s and cold start 503s are retried by the scheduler
+            raise ProviderError(response.status_code, response.text, response.headers.get("Retry-After"))
+        return response
+
+    try:
+        response = scheduler.call("huggingface", API_URL_HUGGING_FACE, post)
+    except ProviderError as e:
+        return f"Error: {e}"
     if response.status_code == 200:
         result = response.json()
         return result[0]["summary_text"]  # Simplified or enhanced text
     else:
         return f"Error: {response.status_code}, {response.text}"
 
-# Function to correct spelling errors
+# Function to correct spelling errors, code spans and identifiers are left alone
 def correct_spelling(text):
-    corrected_text = TextBlob(text).correct()
-    return str(corrected_text)
-
-def response_from_gemini(text):
-
-    genai.configure(api_key = API_KEY_GEMINI)
-    model = genai.GenerativeModel("gemini-1.5-flash")
-    response = model.generate_content(text).text
-
-    return response
+    return spell_index().correct(text)
 
 def save(local_file_path):
 # Read the local file
@@ -55,8 +69,8 @@ def save(local_file_path):
             file_data = file.read()
     
     # Open a dialog box for file saving
-        Tk().withdraw()  # Hides the root window
-        save_path = asksaveasfilename(
+        tkinter.Tk().withdraw()  # Hides the root window
+        save_path = filedialog.asksaveasfilename(
             defaultextension=".png",
             filetypes=[("PNG files", "*.png"), ("All files", "*.*")],
             title="Save Image As"
@@ -80,8 +94,8 @@ def save_docx(local_file_path):
             file_data = file.read()
 
         # Open a dialog box for file saving
-        Tk().withdraw()  # Hides the root window
-        save_path = asksaveasfilename(
+        tkinter.Tk().withdraw()  # Hides the root window
+        save_path = filedialog.asksaveasfilename(
             defaultextension=".docx",
             filetypes=[("DOCX files", "*.docx"), ("All files", "*.*")],
             title="Save file As"
@@ -101,8 +115,8 @@ def save_docx(local_file_path):
 
 def search_pdf():
     # Open a file dialog to search for a PDF file
-    Tk().withdraw()  # Hides the root window
-    pdf_path = askopenfilename(
+    tkinter.Tk().withdraw()  # Hides the root window
+    pdf_path = filedialog.askopenfilename(
         title="Select a PDF File",
         filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
     )
@@ -115,10 +129,18 @@ def search_pdf():
         return None
 
 
-def response_from_together(text):
-    client = together.Together(api_key=API_KEY_TOGETHER)
-    completion = client.chat.completions.create(model="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo", messages=[{"role": "user", "content": text}])
-    return completion.choices[0].message.content
+def sample_uml(text, temperature=0.8):
+    # Uncached sampled stream, used when several different answers to the same prompt are raced.
+    # Not hedged, the candidates already race each other
+    return router.stream("uml", text, cache=False, hedge=False, temperature=temperature)
+
+def stream_chat(text):
+    # General replies, Gemini first and Together when its circuit is open or it fails (see routing.ROUTES)
+    return router.stream("chat", text)
+
+def stream_refine(text):
+    # Prompt refinement, Together first with Gemini as the fallback
+    return router.stream("refine", text)
 
     
     
@@ -129,7 +151,7 @@ if __name__ == "__main__":
     try:
         corrected_text = correct_spelling(user_text)
         simplified_text = simplify_prompt(corrected_text)
-        response = response_from_gemini(simplified_text)
+        response = router.call("chat", simplified_text)
 
     
     
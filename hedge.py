@@ -0,0 +1,170 @@
+import os
+import queue
+import threading
+from scheduler import scheduler
+
+HEDGING = os.getenv("HEDGING", "0") != "0"  # Off by default, a hedge can double the cost of a slow request
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))  # Primary's time to first chunk after which the backup is asked too
+HEDGE_MIN_SAMPLES = 20  # Until the primary has this many samples its delay is HEDGE_DEFAULT_DELAY
+HEDGE_DEFAULT_DELAY = 3.0
+HEDGE_MIN_DELAY = 0.2
+HEDGE_MAX_RATIO = 0.1  # Share of requests that may be hedged, keeps a slow provider from doubling all traffic
+
+
+class Side:
+    """One side of a hedged race, holds what closes its response if it loses while still waiting."""
+
+    def __init__(self):
+        self.closers = []
+        self.lost = False
+        self.lock = threading.Lock()
+
+    def add(self, closer):
+        with self.lock:
+            if not self.lost:
+                self.closers.append(closer)
+                return
+        close_quietly(closer)  # Already lost, the response opened too late
+
+    def lose(self):
+        with self.lock:
+            self.lost = True
+            closers, self.closers = self.closers, []
+        for closer in closers:
+            close_quietly(closer)
+
+
+def close_quietly(closer):
+    try:
+        closer()
+    except Exception:
+        pass  # Already closed, or a generator busy in another thread that stops on its own
+
+
+_current = threading.local()
+
+
+def on_close(closer):
+    """
+    Called by a stream once its response is open: closer() aborts that response if the stream is
+    a side of a hedged race and loses. Does nothing outside a race.
+    """
+    side = getattr(_current, "side", None)
+    if side is not None:
+        side.add(closer)
+
+
+def run_as(side, fn, *args):
+    """fn(*args) with on_close() registering its closers on side, for races run outside Hedger."""
+    _current.side = side
+    try:
+        return fn(*args)
+    finally:
+        _current.side = None
+
+
+class Hedger:
+    """
+    Hedged requests: the primary provider gets a head start of its time-to-first-chunk percentile,
+    after that the backup is asked as well and whichever delivers its first chunk first wins.
+    The loser's response is closed (where its stream registered a closer with on_close), or
+    dropped as soon as its first chunk arrives. A failing primary always fails over to the
+    backup, the hedge budget only limits backups started while the primary is merely slow.
+    """
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, max_ratio=HEDGE_MAX_RATIO):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.calls = 0
+        self.hedged = 0
+        self.backup_wins = 0
+        self._lock = threading.Lock()
+
+    def delay(self, provider, model):
+        # Time to the first chunk of streams only, blocking calls to the same model wait for the whole reply
+        histogram = scheduler.first_chunk(provider, model)
+        if histogram.count < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, histogram.percentile(self.percentile))
+
+    def may_hedge(self):
+        with self._lock:
+            if self.hedged >= self.max_ratio * self.calls + 1:
+                return False
+            self.hedged += 1
+            return True
+
+    def stream(self, primary, backup, *args):
+        """
+        primary and backup are (provider, model, fn) triples, fn(*args) returning a chunk iterator.
+        Yields the chunks of whichever side delivers first, raises if both fail.
+        """
+        with self._lock:
+            self.calls += 1
+        arrivals = queue.Queue()  # (side, first chunk or None, error, iterator)
+        sides = [Side(), Side()]
+        winner = []  # Decided by the first side to deliver a chunk or finish empty
+        decided = threading.Lock()
+
+        def start(index, fn):
+            def run():
+                _current.side = sides[index]
+                try:
+                    iterator = iter(fn(*args))
+                    chunk = next(iterator, None)
+                except Exception as e:
+                    arrivals.put((index, None, e, None))
+                    return
+                finally:
+                    _current.side = None
+                with decided:
+                    if not winner:
+                        winner.append(index)
+                        sides[1 - index].lose()
+                if winner[0] != index:
+                    close_quietly(iterator.close)  # Lost the race, stop reading the reply
+                    return
+                arrivals.put((index, chunk, None, iterator))
+            # Own thread per side, a stalled loser must not hold a worker others are waiting for
+            threading.Thread(target=run, name="hedge", daemon=True).start()
+
+        start(0, primary[2])
+        running = 1
+        backup_started = False
+        timeout = self.delay(primary[0], primary[1])
+        error = None
+        while running:
+            try:
+                index, chunk, failure, iterator = arrivals.get(timeout=timeout)
+            except queue.Empty:
+                # The primary is slower than usual, race it if the budget allows, else keep waiting
+                timeout = None
+                if self.may_hedge():
+                    start(1, backup[2])
+                    backup_started = True
+                    running += 1
+                continue
+            running -= 1
+            if failure is not None:
+                error = failure
+                if not backup_started:
+                    # A failover, not a hedge, so it doesn't need budget
+                    start(1, backup[2])
+                    backup_started = True
+                    running += 1
+                continue
+            if index == 1:
+                with self._lock:
+                    self.backup_wins += 1
+            if chunk is not None:
+                yield chunk
+                yield from iterator
+            return
+        raise error
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "hedged": self.hedged, "backup_wins": self.backup_wins}
+
+
+hedger = Hedger()
@@ -0,0 +1,100 @@
+import os
+from PyQt5.QtCore import QSize, Qt
+from PyQt5.QtGui import QImage, QImageReader, QPainter, QPixmap
+from PyQt5.QtSvg import QSvgRenderer, QSvgWidget
+from PyQt5.QtWidgets import QDialog, QLabel, QScrollArea, QVBoxLayout
+
+THUMBNAIL_SIZE = QSize(800, 600)  # Largest diagram kept in memory per chat entry
+# "svg" shows diagrams from their vector copy when there is one, so zooming never re-renders; "raster" always uses the PNG
+DIAGRAM_DISPLAY = os.getenv("DIAGRAM_DISPLAY", "svg")
+ZOOM_STEP = 1.25
+
+
+def svg_path_for(image_path):
+    """The SVG copy rendered next to a diagram, or None if there is none or SVG display is off."""
+    svg_path = os.path.splitext(image_path)[0] + ".svg"
+    if DIAGRAM_DISPLAY == "svg" and os.path.exists(svg_path):
+        return svg_path
+    return None
+
+
+def fit(size, bounds=THUMBNAIL_SIZE):
+    """size shrunk to fit into bounds keeping the aspect ratio, never enlarged."""
+    if size.width() <= bounds.width() and size.height() <= bounds.height():
+        return size
+    return size.scaled(bounds, Qt.KeepAspectRatio)
+
+
+def load_thumbnail(image_path, size=THUMBNAIL_SIZE):
+    """
+    Decode a diagram straight to thumbnail size. Runs on a worker thread, which is why it
+    returns a QImage: QPixmap may only be created on the GUI thread.
+    """
+    svg_path = svg_path_for(image_path)
+    if svg_path:
+        renderer = QSvgRenderer(svg_path)
+        if renderer.isValid():
+            image = QImage(fit(renderer.defaultSize(), size), QImage.Format_ARGB32_Premultiplied)
+            image.fill(Qt.transparent)
+            painter = QPainter(image)
+            renderer.render(painter)
+            painter.end()
+            return image
+
+    reader = QImageReader(image_path)
+    full_size = reader.size()
+    if full_size.isValid():
+        # Decoders that support it skip the full resolution image entirely, the others scale smoothly after decoding
+        reader.setScaledSize(fit(full_size, size))
+    image = reader.read()
+    if image.isNull():
+        raise RuntimeError(f"Could not load diagram: {reader.errorString()}")
+    return image
+
+
+class ZoomDialog(QDialog):
+    """Full resolution view of a diagram, loaded when opened and dropped when closed. Ctrl+wheel zooms."""
+
+    def __init__(self, image_path, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.setWindowTitle("Diagram")
+        self.scale = 1.0
+        self.full = None
+        self.svg_path = svg_path_for(image_path)
+
+        if self.svg_path:
+            # Vector copy, redrawn sharply at any zoom level
+            self.view = QSvgWidget(self.svg_path)
+            self.natural_size = self.view.renderer().defaultSize()
+        else:
+            self.full = QPixmap(image_path)
+            self.view = QLabel()
+            self.natural_size = self.full.size()
+
+        scroll_area = QScrollArea()
+        scroll_area.setWidget(self.view)
+        scroll_area.setAlignment(Qt.AlignCenter)
+        layout = QVBoxLayout(self)
+        layout.addWidget(scroll_area)
+        self.apply_scale()
+        self.resize(fit(self.natural_size, QSize(1200, 900)) + QSize(40, 40))
+
+    def apply_scale(self):
+        size = self.natural_size * self.scale
+        if self.full is None:
+            self.view.setFixedSize(size)
+        else:
+            pixmap = self.full if self.scale == 1.0 else self.full.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self.view.setPixmap(pixmap)
+            self.view.setFixedSize(pixmap.size())
+
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier:
+            self.scale *= ZOOM_STEP if event.angleDelta().y() > 0 else 1 / ZOOM_STEP
+            self.scale = min(max(self.scale, 0.1), 8.0)
+            self.apply_scale()
+            event.accept()
+        else:
+            super().wheelEvent(event)
+
@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+from cache import CACHE_DIR, make_key
+
+JOURNAL_DIR = os.path.join(CACHE_DIR, "jobs")
+
+
+def is_failed(qa):
+    """Entries that should be regenerated when a job is resumed."""
+    if qa['solution'] == "Failed to generate solution.":
+        return True
+    return isinstance(qa['output'], str) and qa['output'].startswith("Error:")
+
+
+class JobJournal:
+    """
+    Append-only JSONL record of every finished question of an assignment job. One line per
+    result, flushed and synced right away, so a crash never loses finished work.
+    """
+
+    def __init__(self, job_id, directory=JOURNAL_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{job_id}.jsonl")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_pdf(cls, pdf_hash, *settings):
+        # Same PDF with the same generation settings resumes the same job
+        return cls(make_key(pdf_hash, settings))
+
+    def load(self):
+        """Return {idx: qa} of the questions already done, later lines win."""
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn last line from a crash mid-write
+                if is_failed(entry["qa"]):
+                    done.pop(entry["idx"], None)
+                else:
+                    done[entry["idx"]] = entry["qa"]
+        return done
+
+    def record(self, idx, qa):
+        line = json.dumps({"idx": idx, "qa": qa}) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def reset(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
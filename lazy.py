@@ -0,0 +1,68 @@
+import importlib
+import os
+import sys
+import threading
+import time
+
+PREWARM = os.getenv("PREWARM", "1") != "0"  # Import the deferred libraries in the background once the window is up
+STARTUP_REPORT = os.getenv("STARTUP_REPORT", "0") != "0"  # Print import costs after startup
+
+import_times = {}  # module name -> seconds its first import took
+_deferred = []  # Every module handed out by lazy_import, in order
+
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is used, then imports it."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    already = self._name in sys.modules
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    if not already:
+                        import_times[self._name] = time.perf_counter() - start
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    Defer importing a heavy library (provider SDKs, document libraries, tkinter) until its
+    feature is first used, so they stay off the startup path.
+    """
+    module = LazyModule(name)
+    _deferred.append(module)
+    return module
+
+
+def prewarm():
+    """Import every deferred module on a background thread, so the first request doesn't pay for it."""
+    def run():
+        for module in list(_deferred):
+            try:
+                module._load()
+            except Exception as e:
+                # Missing optional libraries surface when their feature is used
+                print(f"Pre-warming {module._name} failed: {e}")
+    threading.Thread(target=run, name="prewarm", daemon=True).start()
+
+
+def startup_report(started):
+    """Print the time to the first window and what the deferred imports cost so far."""
+    print(f"Window shown after {(time.perf_counter() - started) * 1000:.0f} ms")
+    for name, seconds in sorted(import_times.items(), key=lambda item: -item[1]):
+        print(f"  {name:<30} {seconds * 1000:8.1f} ms (deferred)")
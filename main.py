@@ -1,8 +1,17 @@
+import time
+STARTED = time.perf_counter()
+
 from mukul import *
+from lazy import PREWARM, STARTUP_REPORT, prewarm, startup_report
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
+    if STARTUP_REPORT:
+        startup_report(STARTED)
+    if PREWARM:
+        # Provider and document libraries load in the background while the user types
+        QTimer.singleShot(0, prewarm)
     sys.exit(app.exec_())
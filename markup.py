@@ -0,0 +1,88 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from lazy import lazy_import
+
+markdown = lazy_import("markdown")
+
+HTML_CACHE_SIZE = 256  # Rendered replies kept, streaming produces one entry per re-render
+CODE_STYLE = "monokai"  # Pygments style for fenced code
+
+# Styles for the response bubbles, code colours come inline from Pygments
+TEMPLATE_HEAD = """
+<html>
+<head>
+    <style>
+        body {
+            color: white;
+            font-family: 'Segoe UI', sans-serif;
+        }
+        pre {
+            background-color: #2d2d2d;
+            color: #dcdcdc;
+            border-radius: 8px;
+            padding: 10px;
+            overflow-x: auto;
+        }
+        code {
+            font-family: 'Courier New', monospace;
+            font-size: 14px;
+        }
+    </style>
+</head>
+<body>
+"""
+TEMPLATE_TAIL = """
+</body>
+</html>
+"""
+
+
+class MarkdownRenderer:
+    """
+    Markdown to the styled HTML of a response bubble, with fenced code highlighted by Pygments.
+    Keeps one configured Markdown instance and caches the HTML by content hash, so re-rendering
+    an unchanged reply (scrolling back, a streamed reply that is complete) costs a dict lookup.
+    """
+
+    def __init__(self, max_entries=HTML_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.markdown = None  # Built on first use, loading Pygments is not free
+        self._html = OrderedDict()  # content hash -> html
+        self._lock = threading.Lock()
+        self._markdown_lock = threading.Lock()  # Markdown instances aren't thread safe
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def cached(self, text):
+        """The HTML for text if it was rendered before, otherwise None."""
+        key = self.key(text)
+        with self._lock:
+            html = self._html.get(key)
+            if html is not None:
+                self._html.move_to_end(key)
+            return html
+
+    def render(self, text):
+        """Render (or look up) text, safe to call from worker threads."""
+        html = self.cached(text)
+        if html is not None:
+            return html
+        with self._markdown_lock:
+            if self.markdown is None:
+                self.markdown = markdown.Markdown(
+                    extensions=["fenced_code", "codehilite"],
+                    extension_configs={"codehilite": {"noclasses": True, "guess_lang": False, "pygments_style": CODE_STYLE}},
+                )
+            body = self.markdown.reset().convert(text)
+        html = TEMPLATE_HEAD + body + TEMPLATE_TAIL
+        with self._lock:
+            self._html[self.key(text)] = html
+            if len(self._html) > self.max_entries:
+                self._html.popitem(last=False)
+        return html
+
+
+markdown_renderer = MarkdownRenderer()
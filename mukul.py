@@ -1,14 +1,19 @@
-import markdown
-from markdown.extensions.fenced_code import FencedCodeExtension
 from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtGui import QMovie, QPixmap  # Add QPixmap here
 from PyQt5.QtGui import QMovie
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget, QTextEdit, QLabel, QScrollArea, QPushButton, QHBoxLayout)
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QWidget, QTextEdit, QLabel, QPushButton, QHBoxLayout)
 import sys
 import os
 from final import *
 from ones import *
 from auto import *
+from engine import RequestEngine
+from pipeline import run_assignment
+from artifacts import artifacts
+from diagrams import speculative_uml
+from images import DIAGRAM_DISPLAY, load_thumbnail
+from transcript import TranscriptView
+from markup import markdown_renderer
+from compress import compress_prompt
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -23,12 +28,12 @@ class MainWindow(QMainWindow):
         self.layout = QVBoxLayout()
         self.central_widget.setLayout(self.layout)
 
-        # Scrollable container for processed text display
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setStyleSheet(
+        # Chat transcript, only the visible messages are laid out and painted
+        self.transcript = TranscriptView(markdown_renderer)
+        self.messages = self.transcript.model()
+        self.transcript.setStyleSheet(
             """
-            QScrollArea {
+            QListView {
                 border: none;
                 background-color: #2a2d37; /* Dark background */
             }
@@ -44,13 +49,7 @@ class MainWindow(QMainWindow):
             }
             """
         )
-
-        self.output_container = QWidget()
-        self.output_layout = QVBoxLayout()
-        self.output_layout.setSpacing(15)  # Increased spacing between output bubbles
-        self.output_container.setLayout(self.output_layout)
-        self.scroll_area.setWidget(self.output_container)
-        self.layout.addWidget(self.scroll_area)
+        self.layout.addWidget(self.transcript)
 
         # Input and control container
         self.input_control_container = QHBoxLayout()
@@ -135,6 +134,15 @@ class MainWindow(QMainWindow):
         self.progress_label.setAlignment(Qt.AlignCenter)
         self.spinner = QMovie("media/animation.gif")  # Replace with a valid spinner GIF path
         self.progress_label.setMovie(self.spinner)
+        # Let clicks pass through so "Clear Chat" stays usable while requests run
+        self.overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+
+        # Background request engine, every backend call goes through it
+        self.engine = RequestEngine(parent=self)
+        self.engine.busy_changed.connect(self.set_busy)
+
+        # Every response gets its own files, clean up what earlier sessions left behind
+        artifacts.collect_stale()
 
         # Set overall window style
         self.setStyleSheet(
@@ -146,13 +154,8 @@ class MainWindow(QMainWindow):
             """
         )
 
-        # Typing effect setup
-        self.typing_timer = QTimer(self)
-        self.typing_timer.timeout.connect(self.typing_effect)
-
-        self.current_text = ""
-        self.index = 0
-        self.typing_speed = 50  # Speed of typing in milliseconds
+        # Streaming setup, markdown of a growing reply is re-rendered at most this often
+        self.render_interval = 100  # Milliseconds between re-renders
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
@@ -168,267 +171,210 @@ class MainWindow(QMainWindow):
         else:
             QTextEdit.keyPressEvent(self.input_box, event)
 
+    def set_busy(self, busy):
+        # Show the spinner while any request is still in flight
+        self.overlay.setVisible(busy)
+        if busy:
+            self.spinner.start()
+        else:
+            self.spinner.stop()
+
+    def add_user_bubble(self, text):
+        return self.messages.add("user", text)
+
+    def add_response_slot(self):
+        # Reserve a spot right under the prompt so answers stay in order
+        # even when several requests finish out of order
+        return self.messages.add("assistant")
+
+    def show_error(self, slot, message):
+        self.messages.update(slot, error=message)
+
     def process_input(self):
         prompt = self.input_box.toPlainText().strip()
         if not prompt:
             return
 
         # User's input bubble
-        user_label = QLabel(prompt)
-        user_label.setWordWrap(True)
-        user_label.setAlignment(Qt.AlignRight)
-        user_label.setStyleSheet(
-            """
-            QLabel {
-                background-color: #4c8eaf; /* Chat bubble color */
-                color: white;
-                border-radius: 25px;
-                padding: 15px;
-                font-family: 'Segoe UI', sans-serif;
-                font-size: 16px;
-                margin-bottom: 15px;
-            }
-            """
-        )
-        self.output_layout.addWidget(user_label)
-
-        # Show progress indicator
-        self.overlay.setVisible(True)
-        self.spinner.start()
-        QApplication.processEvents()
+        self.add_user_bubble(prompt)
 
         # Clear the input box after processing the input
         self.input_box.clear()  # This line clears the text box
 
-        # Simulate system response with a delay
-        QTimer.singleShot(2000, lambda: self.generate_response(prompt))
+        self.generate_response(prompt, self.add_response_slot())
 
     def process_input_new(self):
         prompt = self.input_box.toPlainText().strip()
         if not prompt:
             return
 
-        # User's input bubble
-        user_label = QLabel(f"User Prompt: {prompt}\nRefined prompt: {response_from_together(f"correct this prompt with no extra words: {prompt}")}")
-        user_label.setWordWrap(True)
-        user_label.setAlignment(Qt.AlignRight)
-        user_label.setStyleSheet(
-            """
-            QLabel {
-                background-color: #4c8eaf; /* Chat bubble color */
-                color: white;
-                border-radius: 25px;
-                padding: 15px;
-                font-family: 'Segoe UI', sans-serif;
-                font-size: 16px;
-                margin-bottom: 15px;
-            }
-            """
-        )
-        self.output_layout.addWidget(user_label)
-
-        # Show progress indicator
-        self.overlay.setVisible(True)
-        self.spinner.start()
-        QApplication.processEvents()
+        # User's input bubble, the refined prompt is filled in once it arrives
+        user_message = self.add_user_bubble(f"User Prompt: {prompt}\nRefined prompt: ...")
+        slot = self.add_response_slot()
 
         # Clear the input box after processing the input
         self.input_box.clear()  # This line clears the text box
 
-        # Simulate system response with a delay
-        QTimer.singleShot(2000, lambda: self.generate_response(response_from_together(f"correct this prompt with no extra words : {prompt}")))
+        def on_compressed(result):
+            compressed, report = result
+            header = f"User Prompt: {prompt}"
+            if report["tokens_saved"]:
+                header += f"\nCompressed: {report['tokens_before']} -> {report['tokens_after']} tokens ({report['tokens_saved']} saved)"
+            self.messages.update(user_message, text=f"{header}\nRefined prompt: ...")
+
+            # Stream the refined prompt straight into the bubble as it is written
+            refined_chunks = []
+
+            def on_chunk(piece):
+                refined_chunks.append(piece)
+                self.messages.update(user_message, text=f"{header}\nRefined prompt: {''.join(refined_chunks)}")
+
+            def on_refined(refined):
+                self.messages.update(user_message, text=f"{header}\nRefined prompt: {refined}")
+                self.generate_response(refined, slot)
+
+            self.engine.submit_stream(
+                stream_refine, f"correct this prompt with no extra words: {compressed}",
+                on_chunk=on_chunk,
+                on_result=on_refined,
+                on_error=lambda message: self.show_error(slot, message),
+            )
 
+        # Long prompts are cut down locally before the refine round trip, TextRank runs off the GUI thread
+        self.engine.submit(compress_prompt, prompt, on_result=on_compressed,
+                           on_error=lambda message: self.show_error(slot, message))
 
+    def generate_response(self, prompt, slot=None):
+        if slot is None:
+            slot = self.add_response_slot()
 
-    def generate_response(self, prompt):
         if 'assignment' in prompt.lower() or 'solution' in prompt.lower() or 'solve' in prompt.lower():
+            # The file dialog has to stay on the GUI thread, the rest runs in the pool
             question_pdf = search_pdf()
-            questions = read_questions_from_pdf(question_pdf)
-            with ThreadPoolExecutor() as executor:
-                qa_list = list(executor.map(process_question, questions))
-            output_docx = 'solutions.docx'
-            print(questions)
-            create_docx(qa_list, output_docx)
-
-            # Create and add the button to the layout
-            button = QPushButton("Download PDF")
-            button.setStyleSheet(
-                """
-                QPushButton {
-                    background-color: #808080;  /* Grey color */
-                    color: white;
-                    border-radius: 10px;
-                    padding: 10px 20px;
-                    font-family: 'Segoe UI', sans-serif;
-                    font-size: 16px;
-                    margin-top: 10px;  /* Space between the image and the button */
-                }
-                QPushButton:hover {
-                    background-color: #A9A9A9;  /* Slightly lighter grey on hover */
-                }
-                """
+            if not question_pdf:
+                return
+            self.messages.update(slot, text="Reading questions...")
+            finished = []
+
+            def on_progress(event):
+                counts = event["counts"]
+                total = counts["total"] if counts["total"] is not None else "?"
+                if event["stage"] == "written":
+                    finished.append(f"Question {event['index']} done: {event['question'][:80]}")
+                status = (f"Parsed {counts['parsed']}/{total} | Resumed {counts['restored']} | Generated {counts['generated']} | "
+                          f"Compiled {counts['compiled']} | Written {counts['written']}")
+                self.messages.update(slot, text="\n".join([status] + finished))
+
+            output_docx = artifacts.new_path(self.messages.owner(slot), 'solutions.docx')
+            self.engine.submit(
+                run_assignment, question_pdf, output_docx,
+                on_progress=on_progress,
+                on_result=lambda output_docx: self.show_assignment(slot, output_docx),
+                on_error=lambda message: self.show_error(slot, message),
             )
-            button.clicked.connect(lambda: save_docx(output_docx))
-
-            # Add the button to the layout
-            self.output_layout.addWidget(button)
-
-            # Stop the spinner and hide the overlay
-            self.spinner.stop()
-            self.overlay.setVisible(False)
-
-    # Handle other cases (e.g., 'diagram' in prompt)
-            
-
 
         elif 'diagram' in prompt.lower() or 'image' in prompt.lower():
-            uml_code = response_from_together(f"generate an extremely perfect uml flow diagram with no extra words and only the code for the prompt : {prompt}")
-            with open("temp_diagram.puml", "w") as file:
-                file.write(uml_code)
-            generate_diagram()
-
-            image_path = "temp_diagram.png"
-            image_label = QLabel()
-            pixmap = QPixmap(image_path)
-            pixmap = pixmap.scaled(800, 600, Qt.KeepAspectRatio, Qt.SmoothTransformation)  # Optional scaling
-            image_label.setPixmap(pixmap)
-            image_label.setAlignment(Qt.AlignCenter)
-            image_label.setStyleSheet(
-                """
-                QLabel {
-                    background-color: #2d2d2d;  /* Dark background for the image container */
-                    border-radius: 10px;
-                    padding: 20px;
-                    margin-bottom: 15px;
-                }
-                """
+            owner = self.messages.owner(slot)
+
+            def build_diagram():
+                # Returns the image path and, when only the SVG was rendered, the UML its PNG is rendered from later
+                image_path = artifacts.new_path(owner, "diagram.png")
+                # Simple use case / flow descriptions are parsed locally and drawn by Graphviz, no LLM or JVM
+                if render_local_diagram(prompt, image_path):
+                    return image_path, None
+                uml_code = try_local_diagram(prompt)
+                if uml_code is None:
+                    # Several sampled candidates at once, the first one that passes the local check wins
+                    uml_code = speculative_uml(sample_uml, f"generate an extremely perfect uml flow diagram with no extra words and only the code for the prompt : {prompt}")
+                # Rendered in memory by a warm PlantUML process, no JVM start per diagram
+                if DIAGRAM_DISPLAY == "svg":
+                    # Shown and thumbnailed from the vector copy, the PNG is only rendered if it is downloaded
+                    render_diagram(uml_code, os.path.splitext(image_path)[0] + ".svg", "svg")
+                    return image_path, uml_code
+                render_diagram(uml_code, image_path)
+                return image_path, None
+
+            def build_and_load_diagram():
+                image_path, pending_uml = build_diagram()
+                # Decoded and scaled here in the worker, the GUI thread only wraps the thumbnail
+                return image_path, pending_uml, load_thumbnail(image_path)
+
+            self.engine.submit(
+                build_and_load_diagram,
+                on_result=lambda result: self.show_diagram(slot, *result),
+                on_error=lambda message: self.show_error(slot, message),
             )
 
-            # Create the button below the image
-            button = QPushButton("Download Image")
-            button.setStyleSheet(
-                """
-                QPushButton {
-                    background-color: #808080;  /* Grey color */
-                    color: white;
-                    border-radius: 10px;
-                    padding: 10px 20px;
-                    font-family: 'Segoe UI', sans-serif;
-                    font-size: 16px;
-                    margin-top: 10px;  /* Space between the image and the button */
-                }
-                QPushButton:hover {
-                    background-color: #A9A9A9;  /* Slightly lighter grey on hover */
-                }
-                """
-            )
-            button.clicked.connect(lambda : save("temp_diagram.png")) 
+        else:
+            self.stream_markdown(slot, stream_chat, prompt)
 
-            # Create a vertical layout to arrange the image and button vertically
-            image_button_layout = QVBoxLayout()
-            image_button_layout.addWidget(image_label)
-            image_button_layout.addWidget(button)
+    def show_assignment(self, slot, output_docx):
+        self.messages.set_action(slot, "Download PDF", lambda: save_docx(output_docx))
 
-            # Add the layout to the output
-            image_container = QWidget()
-            image_container.setLayout(image_button_layout)
-            self.output_layout.addWidget(image_container)
+    def show_diagram(self, slot, image_path, pending_uml, thumbnail):
+        # Only the thumbnail stays in memory (and only while cached), clicking it loads the full resolution diagram
+        self.transcript.cache.put_image(image_path, thumbnail)
+        self.messages.update(slot, image_path=image_path, image_size=(thumbnail.width(), thumbnail.height()))
+        self.messages.set_action(slot, "Download Image", lambda: self.download_diagram(image_path, pending_uml))
 
-            # Hide the progress spinner once the image is displayed
-            self.spinner.stop()
-            self.overlay.setVisible(False)
-        else:
-            try:
-                # Generate AI response
-                response =response_from_gemini(prompt)
-
-                # Convert markdown to HTML with fenced code support
-                html_response = markdown.markdown(
-                    response, extensions=["fenced_code"]
-                )
-
-                # Add custom CSS for styling code blocks
-                styled_html = f"""
-                <html>
-                <head>
-                    <style>
-                        body {{
-                            color: white;
-                            font-family: 'Segoe UI', sans-serif;
-                        }}
-                        pre {{
-                            background-color: #2d2d2d;
-                            color: #dcdcdc;
-                            border-radius: 8px;
-                            padding: 10px;
-                            overflow-x: auto;
-                        }}
-                        code {{
-                            font-family: 'Courier New', monospace;
-                            font-size: 14px;
-                        }}
-                    </style>
-                </head>
-                <body>
-                    {html_response}
-                </body>
-                </html>
-                """
-
-                # Create a QLabel to display the formatted response
-                response_label = QLabel()
-                response_label.setWordWrap(True)
-                response_label.setAlignment(Qt.AlignLeft)
-                response_label.setStyleSheet(
-                    """
-                    QLabel {
-                        background-color: #3e3e5e;
-                        color: white;
-                        border-radius: 25px;
-                        padding: 15px;
-                        font-family: 'Segoe UI', sans-serif;
-                        font-size: 16px;
-                        margin-bottom: 15px;
-                    }
-                    """
-                )
-                response_label.setTextInteractionFlags(Qt.NoTextInteraction)  # Prevent text selection
-
-                # Set the styled HTML content
-                response_label.setText(styled_html)
-                self.output_layout.addWidget(response_label)
-
-                # Stop spinner
-                self.spinner.stop()
-                self.overlay.setVisible(False)
-
-            except Exception as e:
-                # Handle exceptions gracefully
-                error_label = QLabel(f"Error: {e}")
-                error_label.setStyleSheet("color: red;")
-                self.output_layout.addWidget(error_label)
-
-
-
-    def typing_effect(self):
-        if self.index < len(self.current_text):
-            self.response_edit.insertPlainText(self.current_text[self.index])
-            self.index += 1
-        else:
-            # Stop the timer once the text is fully typed out
-            self.typing_timer.stop()
+    def download_diagram(self, image_path, pending_uml):
+        if pending_uml is None:
+            save(image_path)
+            return
+        # Only the SVG was rendered, the PNG comes from the warm render service (or the diagram cache) on a worker
+        self.engine.submit(
+            render_diagram, pending_uml, image_path,
+            on_result=save,
+            on_error=lambda message: print(f"Could not render the diagram as PNG: {message}"),
+        )
+
+    def show_markdown(self, slot, response):
+        self.messages.update(slot, text=response, markdown=True)
+
+    def stream_markdown(self, slot, stream_fn, prompt):
+        """Append chunks to a bubble as they arrive, re-rendering the markdown at a throttled rate."""
+        chunks = []
+
+        # Single shot timer, deleted once the reply is complete
+        render_timer = QTimer(self)
+        render_timer.setSingleShot(True)
+        render_timer.setInterval(self.render_interval)
+        render_timer.timeout.connect(lambda: self.show_markdown(slot, "".join(chunks)))
+
+        def on_chunk(piece):
+            chunks.append(piece)
+            if len(chunks) == 1:
+                # Show the first token right away, later ones are batched
+                self.show_markdown(slot, piece)
+            elif not render_timer.isActive():
+                render_timer.start()
+
+        def on_result(response):
+            render_timer.stop()
+            render_timer.deleteLater()
+            self.show_markdown(slot, response)
+
+        def on_error(message):
+            render_timer.stop()
+            render_timer.deleteLater()
+            self.show_error(slot, message)
+
+        self.engine.submit_stream(
+            stream_fn, prompt,
+            on_chunk=on_chunk,
+            on_result=on_result,
+            on_error=on_error,
+        )
 
     def clear_chat(self):
-        # Remove all widgets from the output layout
-        while self.output_layout.count():
-            widget = self.output_layout.takeAt(0).widget()
-            if widget:
-                widget.deleteLater()
-        self.scroll_area.verticalScrollBar().setValue(0)
+        # Drop every request still in flight so nothing lands in the cleared chat
+        self.engine.cancel_all()
+
+        # Drops the messages, their paged out text and cached renders, and releases their files
+        self.transcript.clear()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
     sys.exit(app.exec_())
-    
\ No newline at end of file
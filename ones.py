@@ -1,70 +1,258 @@
 import os
+import re
 import subprocess
+import dotrender
+from render import render_cached, diagram_cache
+
+# "graphviz" renders the locally parsed diagrams straight with dot, "plantuml" always goes through the JVM
+DIAGRAM_BACKEND = os.getenv("DIAGRAM_BACKEND", "graphviz")
+
+USE_CASE_TRIGGER = re.compile(r"\buse[ -]?case diagram\b", re.IGNORECASE)
+FLOW_TRIGGER = re.compile(r"\b(flow ?diagram|flow ?chart|activity diagram)\b", re.IGNORECASE)
+LIST_KEYWORD = re.compile(r"\b(actors?|use ?cases?|actions)\b\s*(?:are|is|include|:|=)?\s*", re.IGNORECASE)
+ABILITY = re.compile(r"^\s*(?:and\s+)?(?:the\s+|a\s+|an\s+)?([\w ]+?)\s+(?:can|could|may|should be able to|is able to)\s+(.+)$", re.IGNORECASE)
+ITEM_SPLIT = re.compile(r"\s*(?:,|;|&|\band\b|\bor\b)\s*", re.IGNORECASE)
+STEP_SPLIT = re.compile(r"\s*(?:,|;|->|\n|\.\s)\s*")
+STEP_PREFIX = re.compile(r"^(?:first|firstly|next|then|finally|lastly|after that|and)\b\s*", re.IGNORECASE)
+DECISION = re.compile(r"^if\s+(.+?)\s*,?\s*then\s+(.+?)(?:\s*,?\s*(?:else|otherwise)\s+(.+))?$", re.IGNORECASE)
+FILLER = {"a", "an", "the", "with", "for", "of", "steps", "step"}
+# The request around the diagram type, "Please draw a simple use case diagram for an ATM where ..."
+PREAMBLE = re.compile(r"^\s*(?:(?:please|kindly)\s+)?(?:(?:can|could|would)\s+you\s+)?"
+                      r"(?:(?:draw|create|generate|make|build|design|produce|give|show|render)\s+)?(?:me\s+)?"
+                      r"(?:(?:a|an|the)\s+)?(?:(?:simple|basic|small|quick)\s+)?$", re.IGNORECASE)
+SUBJECT = r"(?:(?:for|of|about)\s+(?:(?:a|an|the)\s+)?[\w' -]+?)?\s*"
+USE_CASE_HEAD = re.compile(r"^\s*" + SUBJECT + r"(?:\bwhere\b|\bin which\b|\bwith\b|:|,|\.|-|$)\s*", re.IGNORECASE)
+FLOW_HEAD = re.compile(r"^\s*" + SUBJECT + r",?\s*(?:with\s+(?:the\s+)?steps?\s*(?:are|is|:)?|"
+                       r"(?:(?:the|its)\s+)?(?:steps?|process)\s*(?:are|is|:)|:)\s*", re.IGNORECASE)
+LIST_PREFIX = {"the", "and", "with", "its", "main"}  # Words allowed before "actors are ..."
+ACTOR_NOISE = {"where", "which", "who", "that", "in", "when", "if", "then", "diagram", "use", "case", "system",
+               "draw", "create", "generate", "make", "build", "design", "show", "please"}
+MAX_ACTOR_WORDS = 3
+MAX_STEP_WORDS = 12  # Longer "steps" are prose the local parser has misread
+
+def clean_item(text):
+    words = [word for word in text.strip(" .:;,\"'").split() if word.lower() not in FILLER]
+    return " ".join(words)
+
+def split_items(text):
+    items = (clean_item(item) for item in ITEM_SPLIT.split(text))
+    return [item[0].upper() + item[1:] for item in items if item]
+
+def split_request(trigger, description):
+    """The text after the diagram type, None if what comes before it is more than a plain request."""
+    match = trigger.search(description)
+    if not match or not PREAMBLE.match(description[:match.start()]):
+        return None
+    return description[match.end():]
+
+def parse_use_case(description):
+    """
+    Return (actors, use cases, links) with links as (actor, use case) pairs, all in order of appearance.
+    None as soon as any part of the description isn't understood, so the LLM draws it instead.
+    """
+    actors = {}  # dicts keep insertion order and make membership checks O(1)
+    use_cases = {}
+    links = {}
+    text = split_request(USE_CASE_TRIGGER, description)
+    head = USE_CASE_HEAD.match(text) if text is not None else None
+    if not head:
+        return None
+
+    for clause in re.split(r"[.\n;]", text[head.end():]):
+        if not clause.strip():
+            continue
+        ability = ABILITY.match(clause)
+        if ability and not LIST_KEYWORD.search(clause):
+            # "The customer can browse, order and pay"
+            words = ability.group(1).split()
+            if len(words) > MAX_ACTOR_WORDS or any(word.lower() in ACTOR_NOISE for word in words):
+                return None
+            actor = split_items(ability.group(1))
+            if len(actor) != 1:
+                return None
+            actors[actor[0]] = None
+            for use_case in split_items(ability.group(2)):
+                use_cases[use_case] = None
+                links[(actor[0], use_case)] = None
+            continue
+
+        # "Actors are customer and admin, use cases are browse and pay"
+        matches = list(LIST_KEYWORD.finditer(clause))
+        if not matches or any(word.lower() not in LIST_PREFIX for word in clause[:matches[0].start()].split()):
+            return None
+        for n, match in enumerate(matches):
+            end = matches[n + 1].start() if n + 1 < len(matches) else len(clause)
+            target = actors if match.group(1).lower().startswith("actor") else use_cases
+            for item in split_items(clause[match.end():end]):
+                target[item] = None
+
+    if not links:
+        # No explicit abilities given, every actor takes part in every use case
+        links = {(actor, use_case): None for actor in actors for use_case in use_cases}
+    return list(actors), list(use_cases), list(links)
+
+def use_case_code(actors, use_cases, links):
+    actor_alias = {actor: f"A{n}" for n, actor in enumerate(actors, 1)}
+    use_case_alias = {use_case: f"UC{n}" for n, use_case in enumerate(use_cases, 1)}
+    lines = ["@startuml", "left to right direction"]
+    lines += [f'actor "{actor}" as {alias}' for actor, alias in actor_alias.items()]
+    lines += [f'usecase "{use_case}" as {alias}' for use_case, alias in use_case_alias.items()]
+    lines += [f"{actor_alias[actor]} --> {use_case_alias[use_case]}" for actor, use_case in links]
+    lines.append("@enduml")
+    return "\n".join(lines) + "\n"
+
+def parse_flow(description):
+    """
+    Return a list of steps, each either a string or a (condition, then step, else step) decision.
+    None when the description isn't a plain list of steps.
+    """
+    text = split_request(FLOW_TRIGGER, description)
+    head = FLOW_HEAD.match(text) if text is not None else None
+    if not head:
+        return None
+    parts = [part for part in STEP_SPLIT.split(text[head.end():]) if part.strip()]
+
+    # Put "if x, then y, else z" back together after splitting on commas
+    merged = []
+    for part in parts:
+        if merged and re.match(r"^(then|else|otherwise)\b", part, re.IGNORECASE) and merged[-1].lower().startswith("if "):
+            merged[-1] += " " + part
+        else:
+            merged.append(part)
+
+    steps = []
+    for part in merged:
+        part = STEP_PREFIX.sub("", part.strip())
+        decision = DECISION.match(part)
+        if decision:
+            condition, yes, no = (clean_item(group) if group else None for group in decision.groups())
+            steps.append((condition, yes, no))
+            continue
+        for step in re.split(r"\s*\b(?:and then|then)\b\s*", part, flags=re.IGNORECASE):
+            step = clean_item(step)
+            if len(step.split()) > MAX_STEP_WORDS:
+                return None
+            if step:
+                steps.append(step[0].upper() + step[1:])
+    return steps
+
+def flow_code(steps):
+    lines = ["@startuml", "start"]
+    for step in steps:
+        if isinstance(step, tuple):
+            condition, yes, no = step
+            lines.append(f"if ({condition}?) then (yes)")
+            lines.append(f"  :{yes};")
+            if no:
+                lines.append("else (no)")
+                lines.append(f"  :{no};")
+            lines.append("endif")
+        else:
+            lines.append(f":{step};")
+    lines += ["stop", "@enduml"]
+    return "\n".join(lines) + "\n"
+
+def parse_local_diagram(description):
+    """
+    Parse simple use case and flow descriptions without any network call.
+    Returns ("use case", (actors, use cases, links)), ("flow", steps) or None when the
+    description is outside what the local parser understands.
+    """
+    if USE_CASE_TRIGGER.search(description):
+        parsed = parse_use_case(description)
+        if parsed and parsed[0] and parsed[1]:
+            return "use case", parsed
+    elif FLOW_TRIGGER.search(description):
+        steps = parse_flow(description)
+        if steps and (len(steps) >= 2 or any(isinstance(step, tuple) for step in steps)):
+            return "flow", steps
+    return None
+
+def try_local_diagram(description):
+    """Build PlantUML for simple use case and flow descriptions, None if they can't be parsed locally."""
+    parsed = parse_local_diagram(description)
+    if parsed is None:
+        return None
+    kind, structure = parsed
+    return use_case_code(*structure) if kind == "use case" else flow_code(structure)
+
+def local_dot(description):
+    """Same as try_local_diagram, but as Graphviz DOT."""
+    parsed = parse_local_diagram(description)
+    if parsed is None:
+        return None
+    kind, structure = parsed
+    return dotrender.use_case_dot(*structure) if kind == "use case" else dotrender.flow_dot(structure)
+
+def render_dot_cached(dot_source, fmt="png"):
+    """Graphviz render through the diagram cache, kept apart from PlantUML entries by the format tag."""
+    image = diagram_cache.get(dot_source, f"gv.{fmt}")
+    if image is None:
+        image = dotrender.render_dot(dot_source, fmt)
+        diagram_cache.set(dot_source, f"gv.{fmt}", image)
+    return image
+
+def render_local_diagram(description, image_path):
+    """
+    Render a locally parsed diagram with Graphviz, no JVM involved. An SVG copy is written
+    next to image_path for lossless zoom. Returns image_path, or None if the description
+    can't be parsed locally or Graphviz isn't available.
+    """
+    if DIAGRAM_BACKEND != "graphviz" or not dotrender.available():
+        return None
+    dot_source = local_dot(description)
+    if dot_source is None:
+        return None
+    base = os.path.splitext(image_path)[0]
+    for fmt, path in (("png", image_path), ("svg", base + ".svg")):
+        with open(path, "wb") as file:
+            file.write(render_dot_cached(dot_source, fmt))
+    return image_path
 
 def generate_plantuml_code(description):
     """Generate PlantUML code dynamically based on the description."""
-    description = description.lower()
-
-    if "use case diagram" in description:
-        # Extract actors and use cases
-        actors = []
-        use_cases = []
-        words = description.split()
-        
-        for i, word in enumerate(words):
-            if word in ["actor", "actors"]:
-                actors_start = i + 1
-                while actors_start < len(words) and words[actors_start] != "and":
-                    actors.append(words[actors_start].strip(",").capitalize())
-                    actors_start += 1
-
-            if word in ["actions", "use cases"]:
-                actions_start = i + 1
-                while actions_start < len(words):
-                    use_cases.append(words[actions_start].strip(",").capitalize())
-                    actions_start += 1
-        # Generate PlantUML code
-        plantuml_code = "@startuml\n"
-        for actor in actors:
-            plantuml_code += f"actor {actor}\n"
-        for use_case in use_cases:
-            plantuml_code += f"usecase \"{use_case}\" as UC{use_cases.index(use_case) + 1}\n"
-        for actor in actors:
-            for use_case in use_cases:
-                plantuml_code += f"{actor} --> UC{use_cases.index(use_case) + 1}\n"
-        plantuml_code += "@enduml\n"
-        return plantuml_code
-
-    elif "flow diagram" in description:
-        # Generate a basic flow diagram based on steps
-        steps = [word.strip(",").capitalize() for word in description.split() if word not in ["for", "a", "an", "the", "with", "steps"]]
-        plantuml_code = "@startuml\nstart\n"
-        for step in steps:
-            plantuml_code += f":{step};\n"
-        plantuml_code += "stop\n@enduml\n"
-        return plantuml_code
-
-    else:
-        # Default UML code for unsupported cases
-        return "@startuml\n@enduml\n"
+    # Default UML code for unsupported cases
+    return try_local_diagram(description) or "@startuml\n@enduml\n"
 
 def get_user_input():
     """Prompt the user to enter a description."""
     print("Enter a description of your diagram:")
     return input("> ")
 
-def save_plantuml_code(plantuml_code):
-    """Save the PlantUML code to a temporary file."""
-    with open("temp_diagram.puml", "w") as file:
+def save_plantuml_code(plantuml_code, puml_path="temp_diagram.puml"):
+    """Save the PlantUML code to a file, the GUI passes a per-request path from the artifact store."""
+    with open(puml_path, "w") as file:
         file.write(plantuml_code)
 
-def generate_diagram():
-    """Generate a diagram image using PlantUML."""
+def render_diagram(plantuml_code, image_path, fmt="png"):
+    """Render PlantUML code in memory on the warm render service (or the diagram cache) and write the image."""
+    image = render_cached(plantuml_code, fmt)
+    with open(image_path, "wb") as file:
+        file.write(image)
+    return image_path
+
+def generate_diagram(puml_path="temp_diagram.puml"):
+    """Generate a diagram image using PlantUML, written next to the .puml file."""
+    image_path = os.path.splitext(puml_path)[0] + ".png"
     try:
-        subprocess.run(["plantuml", "temp_diagram.puml"], check=True)
-        print("Diagram generated successfully: output_diagram.png")
-    except subprocess.CalledProcessError as e:
-        print(f"Error generating diagram: {e}")
+        with open(puml_path) as file:
+            code = file.read()
+        # Mermaid flowcharts (which LLMs often answer with) can't go through PlantUML, but Graphviz can draw them
+        dot_source = dotrender.mermaid_dot(code) if dotrender.available() else None
+        if dot_source is not None:
+            with open(image_path, "wb") as file:
+                file.write(render_dot_cached(dot_source))
+        else:
+            render_diagram(code, image_path)
+        print(f"Diagram generated successfully: {image_path}")
+    except (OSError, RuntimeError) as e:
+        # Fall back to a one-off PlantUML run if the render service is unavailable
+        print(f"Render service failed ({e}), running plantuml directly")
+        try:
+            subprocess.run(["plantuml", puml_path], check=True)
+            print(f"Diagram generated successfully: {image_path}")
+        except subprocess.CalledProcessError as e:
+            print(f"Error generating diagram: {e}")
 
 def main():
     """Main function to drive the script."""
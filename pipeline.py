@@ -0,0 +1,189 @@
+import os
+import queue
+import threading
+from auto import iter_questions_from_pdf, solve_question, solve_questions, run_solution, pack_batches, DocxWriter, BATCH_MODE
+from auto import pdf_content_hash, SOLUTION_CHAIN, TEST_INPUTS
+from journal import JobJournal
+
+CHECKPOINT_EVERY = 5  # Save the partial docx after this many new sections
+
+_DONE = object()  # Sentinel passed down the queues when a stage has drained
+
+
+class AssignmentPipeline:
+    """
+    Staged assignment engine: PDF parsing -> LLM generation -> compile and run -> docx writer.
+    Each stage hands items to the next one through a bounded queue, so the first solutions
+    are generated and compiled while later pages are still being parsed.
+    """
+
+    def __init__(self, pdf_path, output_docx, llm_workers=8, compile_workers=None, queue_size=16,
+                 progress=None, cancelled=None, batch=BATCH_MODE, resume=True):
+        self.pdf_path = pdf_path
+        self.resume = resume  # Skip questions the job journal already has
+        self.batch = batch  # Generation stage gets lists of questions packed by token budget
+        self.output_docx = output_docx
+        self.llm_workers = llm_workers
+        self.compile_workers = compile_workers or os.cpu_count() or 2
+        self.progress = progress  # Called with a dict for every stage event
+        self.cancelled = cancelled or threading.Event()
+
+        self.to_generate = queue.Queue(maxsize=queue_size)
+        self.to_compile = queue.Queue(maxsize=queue_size)
+        self.to_write = queue.Queue(maxsize=queue_size)
+
+        self.counts = {"parsed": 0, "restored": 0, "generated": 0, "compiled": 0, "written": 0, "total": None}
+        self.journal = None
+        self.done = {}  # idx -> qa restored from the journal
+        self._lock = threading.Lock()
+        self._live = {}  # stage name -> workers still running
+
+    def emit(self, stage, idx=None, question=None):
+        with self._lock:
+            if stage in self.counts and idx is not None:
+                self.counts[stage] += 1
+            event = {"stage": stage, "index": idx, "question": question, "counts": dict(self.counts)}
+        if self.progress:
+            self.progress(event)
+
+    def put(self, q, item):
+        # Bounded put that gives up once the job is cancelled, so no stage can hang on a full queue
+        while not self.cancelled.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        while not self.cancelled.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def parse(self):
+        if self.batch:
+            for batch in pack_batches(self.parsed_questions()):
+                if not self.put(self.to_generate, batch):
+                    return
+        else:
+            for idx, question in self.parsed_questions():
+                if not self.put(self.to_generate, (idx, question)):
+                    return
+        with self._lock:
+            self.counts["total"] = self.counts["parsed"]
+        for _ in range(self.llm_workers):
+            self.put(self.to_generate, _DONE)
+
+    def parsed_questions(self):
+        for idx, question in enumerate(iter_questions_from_pdf(self.pdf_path), 1):
+            self.emit("parsed", idx, question)
+            restored = self.done.get(idx)
+            if restored is not None and restored['question'] == question:
+                # Finished in an earlier run, goes straight to the writer
+                if not self.put(self.to_write, (idx, restored)):
+                    return
+                self.emit("restored", idx, question)
+                continue
+            yield idx, question
+
+    def solve_batch(self, batch):
+        results = solve_questions([question for _, question in batch])
+        return [(idx, qa) for (idx, _), qa in zip(batch, results)]
+
+    def stage_worker(self, name, inbox, outbox, fn, downstream_workers):
+        while True:
+            item = self.get(inbox)
+            if item is _DONE:
+                break
+            if isinstance(item, list):
+                # A packed batch of (idx, question) pairs, only used by the generation stage
+                try:
+                    results = self.solve_batch(item)
+                except Exception as e:
+                    results = [(idx, self.failed(question, e)) for idx, question in item]
+            else:
+                idx, value = item
+                try:
+                    results = [(idx, fn(value))]
+                except Exception as e:
+                    results = [(idx, self.failed(value, e))]
+            for idx, result in results:
+                if not self.put(outbox, (idx, result)):
+                    break
+                self.emit(name, idx, result['question'])
+            if self.cancelled.is_set():
+                break
+
+        # The last worker of a stage to finish tells the next stage it is done
+        with self._lock:
+            self._live[name] -= 1
+            last = self._live[name] == 0
+        if last:
+            for _ in range(downstream_workers):
+                self.put(outbox, _DONE)
+
+    def failed(self, value, error):
+        # Never lose a question, a failure is written to the document like any other result
+        question = value['question'] if isinstance(value, dict) else value
+        solution = value['solution'] if isinstance(value, dict) else "Failed to generate solution."
+        return {'question': question, 'solution': solution, 'output': f"Error: {error}"}
+
+    def start_stage(self, name, inbox, outbox, fn, workers, downstream_workers):
+        self._live[name] = workers
+        for _ in range(workers):
+            threading.Thread(
+                target=self.stage_worker,
+                args=(name, inbox, outbox, fn, downstream_workers),
+                daemon=True,
+            ).start()
+
+    def run(self):
+        """Run every stage and return the docx path, or None if the job was cancelled."""
+        self.journal = JobJournal.for_pdf(pdf_content_hash(self.pdf_path), SOLUTION_CHAIN, TEST_INPUTS)
+        if self.resume:
+            self.done = self.journal.load()
+        else:
+            self.journal.reset()
+
+        threading.Thread(target=self.parse, daemon=True).start()
+        self.start_stage("generated", self.to_generate, self.to_compile, solve_question,
+                         self.llm_workers, self.compile_workers)
+        self.start_stage("compiled", self.to_compile, self.to_write, run_solution,
+                         self.compile_workers, 1)
+
+        # Writer runs on the calling thread and keeps the document in question order
+        writer = DocxWriter(self.output_docx)
+        waiting = {}
+        next_idx = 1
+        while True:
+            item = self.get(self.to_write)
+            if item is _DONE:
+                break
+            idx, qa = item
+            if self.done.get(idx) is not qa:
+                # Journal new results as soon as they arrive, even if they can't be written in order yet
+                self.journal.record(idx, qa)
+            waiting[idx] = qa
+            while next_idx in waiting:
+                ready = waiting.pop(next_idx)
+                writer.add(next_idx, ready)
+                self.emit("written", next_idx, ready['question'])
+                next_idx += 1
+                if self.counts["written"] % CHECKPOINT_EVERY == 0:
+                    writer.save()  # Partial document on disk in case the window closes
+
+        if self.cancelled.is_set():
+            return None
+        writer.save()
+        self.emit("done")
+        return self.output_docx
+
+
+def run_assignment(pdf_path, output_docx, progress=None, cancelled=None, batch=BATCH_MODE, resume=True):
+    """Convenience wrapper used by the GUI, returns the written docx path."""
+    return AssignmentPipeline(pdf_path, output_docx, progress=progress, cancelled=cancelled,
+                              batch=batch, resume=resume).run()
@@ -0,0 +1,105 @@
+import os
+import threading
+from dotenv import load_dotenv
+from lazy import lazy_import
+
+# Provider SDKs are heavy (grpc, protobuf, httpx), they load on the first request
+requests = lazy_import("requests")
+requests_adapters = lazy_import("requests.adapters")
+together = lazy_import("together")
+genai = lazy_import("google.generativeai")
+
+load_dotenv()
+
+
+class ProviderRegistry:
+    """
+    Creates the Gemini, Together and Hugging Face clients once per process and hands
+    the same instances out on every call, so HTTP connections stay alive and pooled.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=16):
+        self.pool_connections = pool_connections  # Number of hosts kept in the pool
+        self.pool_maxsize = pool_maxsize  # Keep-alive connections per host
+        self._lock = threading.Lock()
+        self._gemini_configured = False
+        self._gemini_models = {}
+        self._together = None
+        self._session = None
+        self._lookups = {"gemini": 0, "together": 0, "huggingface": 0}
+        self._created = {"gemini": 0, "together": 0, "huggingface": 0}
+
+    def gemini_model(self, name="gemini-1.5-flash"):
+        with self._lock:
+            self._lookups["gemini"] += 1
+            if not self._gemini_configured:
+                genai.configure(api_key=os.getenv("API_KEY_GEMINI"))
+                self._gemini_configured = True
+            model = self._gemini_models.get(name)
+            if model is None:
+                model = genai.GenerativeModel(name)
+                self._gemini_models[name] = model
+                self._created["gemini"] += 1
+            return model
+
+    def together_client(self):
+        with self._lock:
+            self._lookups["together"] += 1
+            if self._together is None:
+                self._together = together.Together(api_key=os.getenv("API_KEY_TOGETHER"))
+                self._created["together"] += 1
+            return self._together
+
+    def http_session(self):
+        """Shared requests.Session used for the Hugging Face inference API."""
+        with self._lock:
+            self._lookups["huggingface"] += 1
+            if self._session is None:
+                session = requests.Session()
+                adapter = requests_adapters.HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers["Authorization"] = f"Bearer {os.getenv('API_KEY_HUGGING_FACE')}"
+                self._session = session
+                self._created["huggingface"] += 1
+            return self._session
+
+    def stats(self):
+        """
+        Report client reuse per provider and the state of the HTTP connection pools,
+        handy for sizing pool_maxsize under load.
+        """
+        with self._lock:
+            clients = {}
+            for provider, lookups in self._lookups.items():
+                created = self._created[provider]
+                clients[provider] = {
+                    "lookups": lookups,
+                    "created": created,
+                    "reuse_rate": (lookups - created) / lookups if lookups else 0.0,
+                }
+            session = self._session
+
+        pools = {}
+        if session is not None:
+            adapter = session.get_adapter("https://")
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                opened = pool.num_connections
+                served = pool.num_requests
+                # The pool queue is pre-filled with None slots, only real entries are idle sockets
+                slots = list(pool.pool.queue) if pool.pool else []
+                idle = sum(1 for conn in slots if conn is not None)
+                in_use = pool.pool.maxsize - len(slots) if pool.pool else 0
+                pools[f"{key.key_scheme}://{key.key_host}"] = {
+                    "requests": served,
+                    "connections_opened": opened,
+                    "open_connections": idle + in_use,
+                    "idle_connections": idle,
+                    "reuse_rate": (served - opened) / served if served else 0.0,
+                }
+        return {"clients": clients, "pools": pools}
+
+
+# One registry per process, shared by final.py and auto.py
+registry = ProviderRegistry()
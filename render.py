@@ -0,0 +1,236 @@
+import hashlib
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+from cache import CACHE_DIR
+
+DELIMITER = b"___JOLLY_JOYSTICKS_DIAGRAM_END___"
+RENDER_WORKERS = int(os.getenv("PLANTUML_WORKERS", "2"))
+RENDER_TIMEOUT = 30  # Seconds a single diagram may take before the worker is restarted
+
+
+def plantuml_command():
+    """plantuml from PATH, or java -jar $PLANTUML_JAR if that is set."""
+    jar = os.getenv("PLANTUML_JAR")
+    if jar:
+        return ["java", "-Djava.awt.headless=true", "-jar", jar]
+    if shutil.which("plantuml"):
+        return ["plantuml"]
+    raise FileNotFoundError("PlantUML not found, install it or set PLANTUML_JAR")
+
+
+class RenderWorker:
+    """One long-lived PlantUML JVM in pipe mode, diagrams go in on stdin and images come back on stdout."""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.process = None
+        self.chunks = None
+        self.buffer = b""
+        self.start()
+
+    def start(self):
+        command = plantuml_command() + ["-pipe", f"-t{self.fmt}", "-pipedelimitor", DELIMITER.decode()]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+        self.chunks = queue.Queue()
+        self.buffer = b""
+        threading.Thread(target=self.pump, args=(self.process, self.chunks), daemon=True).start()
+
+    @staticmethod
+    def pump(process, chunks):
+        # Blocking reads happen here so render() can enforce a timeout
+        while True:
+            data = process.stdout.read1(65536)
+            if not data:
+                chunks.put(None)
+                return
+            chunks.put(data)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def render(self, source):
+        source = source.strip()
+        if "@startuml" not in source:
+            source = f"@startuml\n{source}\n@enduml"
+        self.process.stdin.write(source.encode("utf-8") + b"\n")
+        self.process.stdin.flush()
+
+        while DELIMITER not in self.buffer:
+            try:
+                data = self.chunks.get(timeout=RENDER_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError("PlantUML render timed out")
+            if data is None:
+                raise RuntimeError("PlantUML render process exited")
+            self.buffer += data
+        image, self.buffer = self.buffer.split(DELIMITER, 1)
+        self.buffer = self.buffer.lstrip(b"\r\n")
+        return image.lstrip(b"\r\n") if self.fmt == "svg" else image
+
+
+class RenderService:
+    """
+    Pool of warm PlantUML workers, so diagrams skip the JVM cold start. Dead or stuck
+    workers are replaced automatically and the diagram is retried once.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS):
+        self.workers = workers
+        self._idle = {}  # fmt -> queue of idle RenderWorker
+        self._lock = threading.Lock()
+
+    def pool(self, fmt):
+        with self._lock:
+            if fmt not in self._idle:
+                idle = queue.Queue()
+                for _ in range(self.workers):
+                    idle.put(None)  # Started lazily on first use
+                self._idle[fmt] = idle
+            return self._idle[fmt]
+
+    def render(self, source, fmt="png"):
+        """Return the rendered diagram as bytes."""
+        idle = self.pool(fmt)
+        worker = idle.get()
+        try:
+            for attempt in range(2):
+                if worker is None or not worker.alive():
+                    worker = RenderWorker(fmt)
+                try:
+                    return worker.render(source)
+                except (OSError, RuntimeError):
+                    # Crashed or stuck JVM, restart it and try again once
+                    worker.stop()
+                    worker = None
+                    if attempt:
+                        raise
+        finally:
+            idle.put(worker)
+
+    def shutdown(self):
+        with self._lock:
+            pools = list(self._idle.values())
+        for idle in pools:
+            while not idle.empty():
+                worker = idle.get_nowait()
+                if worker is not None:
+                    worker.stop()
+
+
+def normalize_uml(source):
+    """
+    Canonical form of LLM produced UML: markdown fences, prose outside @startuml/@enduml,
+    comments, blank lines and repeated whitespace are dropped. Used both as the cache key
+    and as the text that is actually rendered.
+    """
+    text = source.replace("\r\n", "\n")
+    # Keep only the first fenced block if the reply is wrapped in markdown
+    fenced = re.search(r"```[\w-]*\n(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    start = text.find("@startuml")
+    end = text.find("@enduml", start if start >= 0 else 0)
+    if start >= 0 and end >= 0:
+        text = text[start:end + len("@enduml")]
+
+    text = re.sub(r"/'.*?'/", "", text, flags=re.DOTALL)  # Block comments
+    lines = []
+    for line in text.split("\n"):
+        line = re.sub(r"[ \t]+", " ", line).strip()
+        if not line or line.startswith("'"):
+            continue
+        lines.append(line)
+    body = "\n".join(lines)
+    if not body.startswith("@startuml"):
+        body = f"@startuml\n{body}\n@enduml"
+    return body
+
+
+class DiagramCache:
+    """Rendered diagrams on disk keyed by hash of the normalized UML, evicting least recently used past max_bytes."""
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, source, fmt):
+        digest = hashlib.sha256(f"{fmt}\0{source}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{fmt}")
+
+    def get(self, source, fmt):
+        path = self.path(source, fmt)
+        try:
+            with open(path, "rb") as file:
+                image = file.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        os.utime(path)  # Recently used
+        with self._lock:
+            self.hits += 1
+        return image
+
+    def set(self, source, fmt, image):
+        path = self.path(source, fmt)
+        partial = f"{path}.{threading.get_ident()}.partial"
+        with open(partial, "wb") as file:
+            file.write(image)
+        os.replace(partial, path)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(".partial"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                total -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+render_service = RenderService()
+diagram_cache = DiagramCache(os.path.join(CACHE_DIR, "diagrams"))
+
+
+def render_cached(source, fmt="png"):
+    """Render through the diagram cache, a hit never touches PlantUML."""
+    source = normalize_uml(source)
+    image = diagram_cache.get(source, fmt)
+    if image is None:
+        image = render_service.render(source, fmt)
+        diagram_cache.set(source, fmt, image)
+    return image
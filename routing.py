@@ -0,0 +1,328 @@
+import contextlib
+import functools
+import os
+import threading
+import time
+from collections import deque
+from cache import cached, cached_stream
+from hedge import hedger, on_close, HEDGING
+from providers import registry
+from scheduler import scheduler, status_of
+
+GEMINI_MODEL = "gemini-1.5-flash"
+TOGETHER_MODEL = "meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo"
+TOGETHER_LARGE_MODEL = "meta-llama/Meta-Llama-3.1-70B-Instruct-Turbo"
+CODER_MODEL = "Qwen/Qwen2.5-Coder-32B-Instruct"
+SOLUTION_MODEL = TOGETHER_MODEL
+
+# Fallback chain per task, tried in order. Override one with ROUTE_<TASK>="provider:model,provider:model"
+ROUTES = {
+    "chat": [("gemini", GEMINI_MODEL), ("together", TOGETHER_MODEL), ("together", TOGETHER_LARGE_MODEL)],
+    "refine": [("together", TOGETHER_MODEL), ("gemini", GEMINI_MODEL)],
+    "solution": [("together", SOLUTION_MODEL), ("together", CODER_MODEL), ("gemini", GEMINI_MODEL)],
+    "uml": [("together", TOGETHER_MODEL), ("gemini", GEMINI_MODEL)],
+}
+
+FAILURE_THRESHOLD = 3  # Consecutive failures that open a circuit
+FAILURE_RATE = 0.5  # ... or this share of failures among the last HEALTH_WINDOW calls
+HEALTH_WINDOW = 20
+HEALTH_MIN_CALLS = 10  # Calls in the window before FAILURE_RATE applies
+PROBE_INTERVAL = 15.0  # Seconds before the first probe of an open circuit, doubled after each failed probe
+PROBE_MAX_INTERVAL = 300.0
+PROBE_PROMPT = "ping"
+CALLER_ERRORS = {400, 404, 413, 422}  # The request's fault, not the provider's: falls back but isn't counted
+
+
+def parse_chain(value):
+    """"provider:model,provider:model" -> [(provider, model), ...], the model may contain slashes."""
+    chain = []
+    for item in value.split(","):
+        provider, _, model = item.strip().partition(":")
+        if provider in ADAPTERS and model:
+            chain.append((provider, model))
+    return chain
+
+
+def load_routes():
+    routes = {}
+    for task, chain in ROUTES.items():
+        routes[task] = parse_chain(os.getenv(f"ROUTE_{task.upper()}", "")) or list(chain)
+    return routes
+
+
+def gemini_request(model, prompt, system=None, temperature=None, max_tokens=None, stream=False):
+    config = {}
+    if temperature is not None:
+        config["temperature"] = temperature
+    if max_tokens is not None:
+        config["max_output_tokens"] = max_tokens
+    if system:
+        prompt = f"{system}\n\n{prompt}"
+    send = scheduler.stream if stream else scheduler.call
+    return send("gemini", model, registry.gemini_model(model).generate_content, prompt,
+                generation_config=config or None, stream=stream)
+
+
+def gemini_complete(model, prompt, **params):
+    return gemini_request(model, prompt, **params).text
+
+
+def gemini_stream(model, prompt, **params):
+    response = gemini_request(model, prompt, stream=True, **params)
+    on_close(response.close)  # A hedged race closes the losing stream's connection
+    with contextlib.closing(response):  # Frees its scheduler slot when the reader stops early
+        for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+
+
+def together_request(model, prompt, system=None, temperature=None, max_tokens=None, stream=False):
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": prompt})
+    options = {"stream": True} if stream else {}
+    if temperature is not None:
+        options["temperature"] = temperature
+    if max_tokens is not None:
+        options["max_tokens"] = max_tokens
+    client = registry.together_client()
+    send = scheduler.stream if stream else scheduler.call
+    return send("together", model, client.chat.completions.create, model=model, messages=messages, **options)
+
+
+def together_complete(model, prompt, **params):
+    return together_request(model, prompt, **params).choices[0].message.content
+
+
+def together_stream(model, prompt, **params):
+    response = together_request(model, prompt, stream=True, **params)
+    on_close(response.close)
+    with contextlib.closing(response):
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+# provider -> (blocking call, streaming call), both take (model, prompt, system=, temperature=, max_tokens=)
+ADAPTERS = {
+    "gemini": (gemini_complete, gemini_stream),
+    "together": (together_complete, together_stream),
+}
+
+
+class CircuitBreaker:
+    """
+    Health of one provider/model. The circuit opens after FAILURE_THRESHOLD failures in a row
+    or a FAILURE_RATE share of recent calls failing; an open circuit gets no traffic and probe()
+    is retried in the background, with growing pauses, until it succeeds and closes it again.
+    """
+
+    def __init__(self, probe, threshold=FAILURE_THRESHOLD, rate=FAILURE_RATE, window=HEALTH_WINDOW):
+        self.probe = probe
+        self.threshold = threshold
+        self.rate = rate
+        self.outcomes = deque(maxlen=window)  # True for a success
+        self.consecutive = 0
+        self.successes = 0
+        self.failures = 0
+        self.trips = 0
+        self.probes = 0
+        self.opened_at = None
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def record(self, ok, error=None):
+        with self._lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.successes += 1
+                self.consecutive = 0
+                if self.opened_at is not None:
+                    self.close()  # Tried anyway because the whole chain was down, and it answered
+                return
+            self.failures += 1
+            self.consecutive += 1
+            self.last_error = str(error)
+            failing = self.consecutive >= self.threshold or (
+                len(self.outcomes) >= HEALTH_MIN_CALLS and self.outcomes.count(False) >= self.rate * len(self.outcomes))
+            if self.opened_at is not None or not failing:
+                return
+            self.opened_at = time.monotonic()
+            self.trips += 1
+        print(f"Circuit opened after {self.consecutive} failures in a row, last error: {error}")
+        threading.Thread(target=self.probe_until_closed, name="probe", daemon=True).start()
+
+    def close(self):
+        # Called with the lock held
+        self.opened_at = None
+        self.consecutive = 0
+        self.outcomes.clear()
+
+    def probe_until_closed(self):
+        interval = PROBE_INTERVAL
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                if self.opened_at is None:
+                    return
+                self.probes += 1
+            try:
+                self.probe()
+            except Exception as e:
+                self.last_error = str(e)
+                interval = min(interval * 2, PROBE_MAX_INTERVAL)
+                continue
+            with self._lock:
+                self.close()
+            return
+
+    def stats(self):
+        with self._lock:
+            calls = self.successes + self.failures
+            return {
+                "state": "open" if self.opened_at is not None else "closed",
+                "calls": calls,
+                "success_rate": self.successes / calls if calls else None,
+                "trips": self.trips,
+                "probes": self.probes,
+                "last_error": self.last_error,
+            }
+
+
+class Target:
+    """One provider/model of the fallback chains, with its circuit breaker. Shared by every task that routes to it."""
+
+    def __init__(self, provider, model):
+        self.provider = provider
+        self.model = model
+        self._complete, self._stream = ADAPTERS[provider]
+        self.breaker = CircuitBreaker(self.probe)
+        # Same keys the direct per-provider functions used before, so their cached replies are reused
+        self.complete = cached(provider, model)(self.complete_tracked)
+        self.stream = cached_stream(provider, model)(self.stream_tracked)
+
+    @property
+    def name(self):
+        return f"{self.provider}/{self.model}"
+
+    def failed(self, error):
+        if status_of(error) not in CALLER_ERRORS:
+            self.breaker.record(False, error)
+
+    def complete_tracked(self, prompt, **params):
+        try:
+            result = self._complete(self.model, prompt, **params)
+        except Exception as e:
+            self.failed(e)
+            raise
+        self.breaker.record(True)
+        return result
+
+    def stream_tracked(self, prompt, **params):
+        # Healthy once the first chunk arrives, a stream that breaks later can't be failed over anyway
+        chunks = self._stream(self.model, prompt, **params)
+        try:
+            first = next(chunks)
+        except StopIteration:
+            self.breaker.record(True)
+            return
+        except Exception as e:
+            self.failed(e)
+            raise
+        self.breaker.record(True)
+        yield first
+        yield from chunks
+
+    def probe(self):
+        self._complete(self.model, PROBE_PROMPT, max_tokens=1)
+
+    def stats(self):
+        stats = self.breaker.stats()
+        latency = scheduler.latency(self.provider, self.model)
+        first_chunk = scheduler.first_chunk(self.provider, self.model)
+        stats["latency_p50"] = latency.percentile(50)
+        stats["latency_p95"] = latency.percentile(95)
+        stats["first_chunk_p95"] = first_chunk.percentile(95)
+        return stats
+
+
+class Router:
+    """
+    Sends each task to the first model of its fallback chain whose circuit is closed, and on to
+    the next one when a call fails. Streams fail over until their first chunk, after that an
+    error reaches the caller. With HEDGING the first two healthy models of a stream are raced.
+    """
+
+    def __init__(self, routes=None):
+        self.routes = routes or load_routes()
+        self._targets = {}
+        self._lock = threading.Lock()
+
+    def target(self, provider, model):
+        with self._lock:
+            key = (provider, model)
+            if key not in self._targets:
+                self._targets[key] = Target(provider, model)
+            return self._targets[key]
+
+    def chain(self, task):
+        """The task's targets with a closed circuit, in order. If every circuit is open the whole chain is tried anyway."""
+        targets = [self.target(provider, model) for provider, model in self.routes[task]]
+        return [target for target in targets if not target.breaker.is_open] or targets
+
+    def call(self, task, prompt, cache=True, **params):
+        """Reply of the first model in the chain that answers, cache=False for sampled or already cached calls."""
+        return self.answer(task, prompt, cache, **params)[0]
+
+    def answer(self, task, prompt, cache=True, **params):
+        """Same as call(), returns (reply, "provider/model" that gave it)."""
+        error = None
+        for target in self.chain(task):
+            complete = target.complete if cache else target.complete.uncached
+            try:
+                return complete(prompt, **params), target.name
+            except Exception as e:
+                print(f"{task}: {target.name} failed, trying the next model\nError: {e}")
+                error = e
+        raise error
+
+    def stream(self, task, prompt, cache=True, hedge=HEDGING, **params):
+        targets = self.chain(task)
+
+        def opener(target):
+            return functools.partial(target.stream if cache else target.stream.uncached, **params)
+
+        attempts = []  # (name, start) pairs, start() returns the chunk iterator
+        if hedge and len(targets) > 1:
+            pair = [(target.provider, target.model, opener(target)) for target in targets[:2]]
+            attempts.append((f"{targets[0].name} hedged with {targets[1].name}", lambda: hedger.stream(*pair, prompt)))
+            # A race only fails once the primary and the backup both failed, so neither is asked again
+            targets = targets[2:]
+        attempts += [(target.name, lambda target=target: opener(target)(prompt)) for target in targets]
+
+        error = None
+        for name, start in attempts:
+            chunks = iter(start())
+            try:
+                first = next(chunks)
+            except StopIteration:
+                return
+            except Exception as e:
+                print(f"{task}: {name} failed, trying the next model\nError: {e}")
+                error = e
+                continue
+            yield first
+            yield from chunks
+            return
+        raise error
+
+    def stats(self):
+        with self._lock:
+            targets = list(self._targets.values())
+        return {target.name: target.stats() for target in targets}
+
+
+router = Router()
@@ -0,0 +1,93 @@
+import collections
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RUN_CPU_SECONDS = 2
+RUN_MEMORY_MB = 256
+RUN_FILE_MB = 16  # Largest file a solution may write, the scratch dir is usually RAM backed
+COMPILE_CPU_SECONDS = 20
+COMPILE_MEMORY_MB = 1024
+COMPILE_FILE_MB = 64
+
+# Limits are set by a shell that then execs the command: a preexec_fn can deadlock a child forked
+# from this multithreaded process. ulimit -v is in KiB, -f in 512 byte blocks (POSIX sh)
+LIMIT_SCRIPT = 'ulimit -t {cpu} && ulimit -v {memory} && ulimit -f {blocks} && ulimit -c 0 && exec "$@"'
+
+
+def scratch_root():
+    """Prefer a tmpfs (/dev/shm) for sources and runs, fall back to the normal temp dir."""
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return os.path.join("/dev/shm", "jolly-joysticks")
+    return os.path.join(tempfile.gettempdir(), "jolly-joysticks")
+
+
+def limited(command, cpu_seconds, memory_mb, file_mb):
+    """command wrapped so it runs with capped CPU time, address space and file size, and no core dumps."""
+    if os.name != "posix":
+        return list(command)  # No ulimit on Windows, the timeouts are the only bound there
+    script = LIMIT_SCRIPT.format(cpu=cpu_seconds, memory=memory_mb * 1024, blocks=file_mb * 2048)
+    return ["/bin/sh", "-c", script, "sh", *command]
+
+
+class SandboxPool:
+    """
+    Bounded pool for compiling and running untrusted solutions, kept apart from the LLM
+    workers so compile concurrency can be tuned on its own.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.scratch_dir = scratch_root()
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sandbox")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._durations = collections.deque(maxlen=500)  # Seconds per finished task
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self._queued += 1
+
+        def timed():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._durations.append(time.perf_counter() - started)
+
+        return self._executor.submit(timed)
+
+    def run(self, fn, *args, **kwargs):
+        return self.submit(fn, *args, **kwargs).result()
+
+    def map(self, fn, items):
+        return [future.result() for future in [self.submit(fn, item) for item in items]]
+
+    def stats(self):
+        with self._lock:
+            durations = sorted(self._durations)
+            stats = {
+                "workers": self.workers,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+            }
+        if durations:
+            stats["avg_seconds"] = sum(durations) / len(durations)
+            stats["p95_seconds"] = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+            stats["max_seconds"] = durations[-1]
+        return stats
+
+
+sandbox_pool = SandboxPool()
@@ -0,0 +1,318 @@
+import math
+import random
+import threading
+import time
+
+# requests per second, burst size, maximum concurrency, per provider
+PROVIDER_LIMITS = {
+    "together": (10.0, 10, 16),
+    "gemini": (1.0, 5, 8),
+    "huggingface": (2.0, 4, 4),
+}
+DEFAULT_LIMITS = (2.0, 4, 4)
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class ProviderError(Exception):
+    """Raised for HTTP failures of plain requests calls so the scheduler can decide to retry."""
+
+    def __init__(self, status_code, message, retry_after=None):
+        super().__init__(f"{status_code}, {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def status_of(error):
+    """Dig the HTTP status out of the different SDK exception types."""
+    for attr in ("status_code", "http_status", "code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    if isinstance(value, int):
+        return value
+    # google.api_core exceptions carry a grpc style code object with an int value
+    grpc_code = getattr(error, "grpc_status_code", None)
+    if grpc_code is not None and grpc_code.name in ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED"):
+        return 429 if grpc_code.name == "RESOURCE_EXHAUSTED" else 503
+    return None
+
+
+def retry_after_of(error):
+    if getattr(error, "retry_after", None) is not None:
+        return float(error.retry_after)
+    headers = getattr(error, "headers", None) or getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+class TokenBucket:
+    """Classic token bucket, acquire() blocks until a request may go out."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # A Retry-After from the server empties the bucket for that long
+        with self._lock:
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: grows by one per window of successes, halves on throttling."""
+
+    def __init__(self, initial, maximum, minimum=1):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.minimum = minimum
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class LatencyHistogram:
+    """
+    Log bucketed call latencies, 10 ms to ~15 min in 10% steps. Counts are halved every window
+    samples so percentiles follow the provider's recent behaviour.
+    """
+
+    def __init__(self, smallest=0.01, growth=1.1, buckets=120, window=500):
+        self.smallest = smallest
+        self.growth = growth
+        self.window = window
+        self.counts = [0] * buckets
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        if seconds <= self.smallest:
+            bucket = 0
+        else:
+            bucket = min(int(math.log(seconds / self.smallest, self.growth)) + 1, len(self.counts) - 1)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            if self.count >= self.window:
+                self.counts = [count // 2 for count in self.counts]
+                self.count = sum(self.counts)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, None without samples."""
+        with self._lock:
+            if not self.count:
+                return None
+            target = max(1, math.ceil(p / 100 * self.count))
+            seen = 0
+            for bucket, count in enumerate(self.counts):
+                seen += count
+                if seen >= target:
+                    return self.smallest * self.growth ** bucket
+        return None
+
+
+class ProviderScheduler:
+    """Paces, limits and retries calls to one provider/model pair."""
+
+    def __init__(self, rate, burst, max_concurrency, max_retries=5, base_delay=0.5, max_delay=30.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AdaptiveLimiter(initial=max(1, max_concurrency // 2), maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self._lock = threading.Lock()  # Counters are updated from every thread calling this provider
+        self.latency = LatencyHistogram()  # Successful calls only, until the whole reply is in
+        self.first_chunk = LatencyHistogram()  # Streams only, until their first chunk arrives
+
+    def open(self, fn, args, kwargs):
+        """Paced and retried fn(*args, **kwargs), returns (result, start time) still holding a concurrency slot."""
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            self.limiter.acquire()
+            with self._lock:
+                self.calls += 1
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                status = status_of(e)
+                throttled = status == 429
+                self.limiter.release(throttled)
+                if status not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                retry_after = retry_after_of(e)
+            else:
+                return result, started
+
+            with self._lock:
+                if throttled:
+                    self.throttled += 1
+                self.retries += 1
+            # Full jitter exponential backoff, but never sooner than the server asked for
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+                self.bucket.pause(retry_after)
+            time.sleep(delay)
+            attempt += 1
+
+    def call(self, fn, /, *args, **kwargs):
+        result, started = self.open(fn, args, kwargs)
+        self.latency.record(time.monotonic() - started)
+        self.limiter.release()
+        return result
+
+    def stream(self, fn, /, *args, **kwargs):
+        """Like call() for an fn returning a chunk iterator, the slot is held until it is read to the end or closed."""
+        response, started = self.open(fn, args, kwargs)
+        return ScheduledStream(self, response, started)
+
+    def stats(self):
+        with self._lock:
+            counters = {"calls": self.calls, "retries": self.retries, "throttled": self.throttled,
+                        "failures": self.failures}
+        return {
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            **counters,
+            "latency_p50": self.latency.percentile(50),
+            "latency_p95": self.latency.percentile(95),
+            "first_chunk_p50": self.first_chunk.percentile(50),
+            "first_chunk_p95": self.first_chunk.percentile(95),
+        }
+
+
+class ScheduledStream:
+    """
+    Streaming response of ProviderScheduler.stream(). Keeps its concurrency slot until the
+    stream ends, fails or is closed, records the time to its first chunk and, once the last
+    chunk is in, the latency.
+    """
+
+    def __init__(self, scheduler, response, started):
+        self.scheduler = scheduler
+        self.response = response
+        self.started = started
+        self.chunks = iter(response)
+        self.waiting = True  # For the first chunk
+        self.done = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.finish(completed=True)
+            raise
+        except Exception as e:
+            self.finish(error=e)
+            raise
+        if self.waiting:
+            self.waiting = False
+            self.scheduler.first_chunk.record(time.monotonic() - self.started)
+        return chunk
+
+    def close(self):
+        """Aborts the response where the SDK object can close its connection, and frees the slot."""
+        try:
+            for owner in (self.response, getattr(self.response, "response", None)):
+                if callable(getattr(owner, "close", None)):
+                    owner.close()
+                    break
+        finally:
+            self.finish()
+
+    def finish(self, completed=False, error=None):
+        # Reached from the reading thread and from close() on another one, only the first counts
+        with self._lock:
+            if self.done:
+                return
+            self.done = True
+        scheduler = self.scheduler
+        if completed:
+            scheduler.latency.record(time.monotonic() - self.started)
+        if error is not None:
+            with scheduler._lock:
+                scheduler.failures += 1
+        scheduler.limiter.release(error is not None and status_of(error) == 429)
+
+
+class Scheduler:
+    """One ProviderScheduler per (provider, model), created on first use."""
+
+    def __init__(self, limits=None):
+        self.limits = limits or PROVIDER_LIMITS
+        self._schedulers = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider, model):
+        with self._lock:
+            key = (provider, model)
+            if key not in self._schedulers:
+                self._schedulers[key] = ProviderScheduler(*self.limits.get(provider, DEFAULT_LIMITS))
+            return self._schedulers[key]
+
+    def call(self, provider, model, fn, /, *args, **kwargs):
+        # Positional only, so fn's own model= keyword passes straight through
+        return self.get(provider, model).call(fn, *args, **kwargs)
+
+    def stream(self, provider, model, fn, /, *args, **kwargs):
+        return self.get(provider, model).stream(fn, *args, **kwargs)
+
+    def latency(self, provider, model):
+        return self.get(provider, model).latency
+
+    def first_chunk(self, provider, model):
+        return self.get(provider, model).first_chunk
+
+    def stats(self):
+        with self._lock:
+            return {f"{provider}/{model}": s.stats() for (provider, model), s in self._schedulers.items()}
+
+
+scheduler = Scheduler()
@@ -0,0 +1,262 @@
+import array
+import bisect
+import importlib.util
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+from cache import CACHE_DIR
+
+MAX_DISTANCE = 2  # Largest edit distance corrected
+PREFIX_LENGTH = 7  # Only word prefixes are indexed, as in SymSpell, which keeps the index small
+INDEX_VERSION = 1
+INDEX_PATH = os.path.join(CACHE_DIR, "spelling", f"index-v{INDEX_VERSION}.bin")
+MAGIC = b"JJSP" if sys.byteorder == "little" else b"PSJJ"  # Arrays are stored in native byte order
+HEADER = struct.Struct("=4s7I")  # magic, version, max distance, prefix length, words, buckets, entries, blob size
+
+# Code blocks and inline code are never touched
+CODE_SPAN = re.compile(r"```.*?(?:```|$)|`[^`\n]*`", re.DOTALL)
+TOKEN = re.compile(r"\S+")
+WORD = re.compile(r"^([(\[{\"']*)([A-Za-z][a-z']*|[A-Z][a-z']+)([)\]}\"'.,!?;:]*)$")
+# Technical words the prose dictionary doesn't know
+KEEP = {"api", "apis", "cpp", "css", "csv", "gcc", "html", "http", "https", "java", "json", "jsx", "npm", "pdf",
+        "php", "pip", "python", "sql", "svg", "uml", "url", "xml", "yaml", "ascii", "bool", "enum", "struct",
+        "printf", "scanf", "malloc", "stdin", "stdout", "regex", "async", "init", "params", "args", "config",
+        "admin", "stack", "heap", "usecase", "login", "logout", "backend", "frontend"}
+
+
+def dictionary_path():
+    """Word frequency list shipped with TextBlob (found without importing it), or $SPELLING_DICTIONARY."""
+    path = os.getenv("SPELLING_DICTIONARY")
+    if path:
+        return path
+    spec = importlib.util.find_spec("textblob")
+    if spec is None:
+        raise FileNotFoundError("No spelling dictionary, install textblob or set SPELLING_DICTIONARY")
+    return os.path.join(os.path.dirname(spec.origin), "en", "en-spelling.txt")
+
+
+def read_frequencies(path):
+    """{word: count} from a "word count" per line file, ;;; lines are comments."""
+    counts = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 2 and not line.startswith(";;;") and parts[1].isdigit():
+                word = parts[0].lower()
+                counts[word] = counts.get(word, 0) + int(parts[1])
+    return counts
+
+
+def deletes(word, max_distance):
+    """word and every string reachable from it by deleting up to max_distance characters."""
+    found = {word}
+    frontier = [word]
+    for _ in range(max_distance):
+        next_frontier = []
+        for text in frontier:
+            for i in range(len(text)):
+                deleted = text[:i] + text[i + 1:]
+                if deleted not in found:
+                    found.add(deleted)
+                    next_frontier.append(deleted)
+        frontier = next_frontier
+    return found
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (adjacent swaps count once), anything above limit is limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def build_index(source, path, max_distance=MAX_DISTANCE, prefix_length=PREFIX_LENGTH):
+    """
+    Write the deletion index for the frequency list source to path. Layout, all arrays uint32:
+    header, word offsets, word counts, bucket starts, entry hashes, entry word ids, then the
+    sorted words as one UTF-8 blob. Entries are (crc32 of a delete, word id) grouped by bucket.
+    """
+    counts = read_frequencies(source)
+    words = sorted(counts)
+    blob = bytearray()
+    offsets = array.array("I", [0])
+    for word in words:
+        blob += word.encode("utf-8")
+        offsets.append(len(blob))
+
+    entries = set()
+    for word_id, word in enumerate(words):
+        for deleted in deletes(word[:prefix_length], max_distance):
+            entries.add((zlib.crc32(deleted.encode("utf-8")), word_id))
+    bucket_count = 1 << max(len(entries) // 2, 1).bit_length()
+    mask = bucket_count - 1
+    ordered = sorted(entries, key=lambda entry: (entry[0] & mask, entry[0]))
+
+    buckets = array.array("I", [0]) * (bucket_count + 1)
+    for hash_value, _ in ordered:
+        buckets[(hash_value & mask) + 1] += 1
+    for bucket in range(bucket_count):
+        buckets[bucket + 1] += buckets[bucket]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f"{path}.{os.getpid()}.partial"
+    with open(partial, "wb") as file:
+        file.write(HEADER.pack(MAGIC, INDEX_VERSION, max_distance, prefix_length, len(words), bucket_count,
+                               len(ordered), len(blob)))
+        offsets.tofile(file)
+        array.array("I", (counts[word] for word in words)).tofile(file)
+        buckets.tofile(file)
+        array.array("I", (hash_value for hash_value, _ in ordered)).tofile(file)
+        array.array("I", (word_id for _, word_id in ordered)).tofile(file)
+        file.write(blob)
+    os.replace(partial, path)
+
+
+class SpellIndex:
+    """
+    SymSpell style corrector over a memory mapped deletion index: a lookup hashes the deletes
+    of the word's prefix and verifies the few words they point to, nothing is loaded up front.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_distance, self.prefix_length, words, buckets, entries, blob_size = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"{path} is not a spelling index of this version")
+
+        view = memoryview(self.map)
+        position = HEADER.size
+
+        def section(count):
+            nonlocal position
+            part = view[position:position + 4 * count].cast("I")
+            position += 4 * count
+            return part
+
+        self.offsets = section(words + 1)
+        self.counts = section(words)
+        self.buckets = section(buckets + 1)
+        self.hashes = section(entries)
+        self.word_ids = section(entries)
+        self.blob = view[position:position + blob_size]
+        self.mask = buckets - 1
+        self.words = WordList(self)
+
+    def word(self, word_id):
+        return bytes(self.blob[self.offsets[word_id]:self.offsets[word_id + 1]]).decode("utf-8")
+
+    def __contains__(self, word):
+        position = bisect.bisect_left(self.words, word)
+        return position < len(self.words) and self.words[position] == word
+
+    def lookup(self, word):
+        """Closest dictionary word (fewest edits, then most frequent), word itself if known, None if nothing is close."""
+        if word in self:
+            return word
+        candidates = set()
+        for deleted in deletes(word[:self.prefix_length], self.max_distance):
+            hash_value = zlib.crc32(deleted.encode("utf-8"))
+            bucket = hash_value & self.mask
+            for entry in range(self.buckets[bucket], self.buckets[bucket + 1]):
+                if self.hashes[entry] == hash_value:
+                    candidates.add(self.word_ids[entry])
+
+        best = None
+        limit = self.max_distance
+        length = len(word.encode("utf-8"))
+        for word_id in candidates:
+            if abs(self.offsets[word_id + 1] - self.offsets[word_id] - length) > limit:
+                continue  # Too long or short, without decoding it
+            # Only as close as the best so far can still win, a tighter limit stops the DP earlier
+            distance = edit_distance(word, self.word(word_id), limit)
+            if distance <= limit:
+                key = (distance, -self.counts[word_id])
+                if best is None or key < best[0]:
+                    best = (key, word_id)
+                    limit = distance
+        return self.word(best[1]) if best else None
+
+    def correct_token(self, token, memo):
+        match = WORD.match(token)
+        if not match:
+            return token  # Identifiers, numbers, paths, camelCase, ALLCAPS
+        before, word, after = match.groups()
+        lowered = word.lower()
+        if len(lowered) < 3 or lowered in KEEP:
+            return token
+        if lowered not in memo:
+            memo[lowered] = self.lookup(lowered) or lowered
+        corrected = memo[lowered]
+        if word[0].isupper():
+            corrected = corrected[0].upper() + corrected[1:]
+        return before + corrected + after
+
+    def correct(self, text, memo=None):
+        """Correct the prose of text, leaving code spans, identifiers and whitespace untouched."""
+        memo = {} if memo is None else memo
+        pieces = []
+        position = 0
+        for code in CODE_SPAN.finditer(text):
+            pieces.append(self.correct_prose(text[position:code.start()], memo))
+            pieces.append(code.group())
+            position = code.end()
+        pieces.append(self.correct_prose(text[position:], memo))
+        return "".join(pieces)
+
+    def correct_prose(self, text, memo):
+        return TOKEN.sub(lambda token: self.correct_token(token.group(), memo), text)
+
+    def correct_batch(self, texts):
+        """Correct several prompts, words repeated across them are looked up once."""
+        memo = {}
+        return [self.correct(text, memo) for text in texts]
+
+
+class WordList:
+    """The sorted words of an index as a sequence, for bisect."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index.counts)
+
+    def __getitem__(self, word_id):
+        return self.index.word(word_id)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def spell_index():
+    """The shared index, built from the dictionary the first time it is needed on this machine."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            if not os.path.exists(INDEX_PATH):
+                build_index(dictionary_path(), INDEX_PATH)
+            _index = SpellIndex(INDEX_PATH)
+        return _index
+
+
+if __name__ == "__main__":
+    build_index(dictionary_path(), INDEX_PATH)
+    print(f"Spelling index written to {INDEX_PATH} ({os.path.getsize(INDEX_PATH) / 1e6:.1f} MB)")
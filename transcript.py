@@ -0,0 +1,494 @@
+import html
+import math
+import os
+import sqlite3
+import tempfile
+from collections import OrderedDict
+from PyQt5.QtCore import QAbstractListModel, QEvent, QModelIndex, QRect, QSize, Qt, QTimer
+from PyQt5.QtGui import QColor, QFont, QFontMetrics, QPainter, QPixmap, QTextDocument
+from PyQt5.QtWidgets import QAbstractItemView, QListView, QStyledItemDelegate
+from artifacts import artifacts
+from engine import RequestEngine
+from images import ZoomDialog, load_thumbnail
+
+RESIDENT_MESSAGES = 100  # Newest messages whose text stays in memory, older ones are paged out to disk
+RELOADED_MESSAGES = 30  # Paged out messages read back for display, kept until this many others were read
+DOCUMENT_CACHE_SIZE = 64  # Rendered messages (laid out QTextDocuments)
+IMAGE_CACHE_SIZE = 16  # Diagram thumbnails
+HEIGHT_WIDTHS = 4  # Laid out heights remembered per message, one per viewport width
+
+MARGIN = 8  # Around every bubble
+PADDING = 15  # Inside a bubble
+SPACING = 10  # Between the parts of a bubble
+BUTTON_HEIGHT = 40
+BUBBLE_COLORS = {"user": "#4c8eaf", "assistant": "#3e3e5e"}
+IMAGE_BACKGROUND = "#2d2d2d"
+BUTTON_COLOR = "#808080"
+
+
+def bubble_font():
+    font = QFont("Segoe UI")
+    font.setPixelSize(16)
+    return font
+
+
+def text_metrics(message):
+    """Length and paragraph lengths of a message's text, kept in memory for height estimates when it's paged out."""
+    text = message["text"] or ""
+    message["length"] = len(text)
+    message["paragraphs"] = [len(paragraph) for paragraph in text.split("\n")]
+
+
+class MessageStore:
+    """
+    Transcript messages by id, in order. Only the newest RESIDENT_MESSAGES keep their text in
+    memory, the text of older ones lives in a SQLite page file and is read back when shown.
+    """
+
+    def __init__(self, resident=RESIDENT_MESSAGES):
+        self.resident = resident
+        self.messages = {}  # id -> message dict, "text" is None while paged out
+        self.order = []
+        self.paged_until = 0  # Messages before this position are paged out
+        self.reloaded = OrderedDict()  # Paged out ids whose text was read back, least recently used first
+        self.next_id = 0
+        self.db = None
+        self.path = None
+
+    def page_file(self):
+        if self.db is None:
+            fd, self.path = tempfile.mkstemp(prefix="jolly-joysticks-transcript-", suffix=".sqlite")
+            os.close(fd)
+            self.db = sqlite3.connect(self.path)
+            self.db.execute("CREATE TABLE pages (id INTEGER PRIMARY KEY, text TEXT NOT NULL)")
+        return self.db
+
+    def append(self, message):
+        message["id"] = self.next_id
+        self.next_id += 1
+        text_metrics(message)
+        self.messages[message["id"]] = message
+        self.order.append(message["id"])
+        self.trim()
+        return message["id"]
+
+    def row(self, message_id):
+        # Ids are handed out in order and only ever removed all at once
+        return message_id - self.order[0] if message_id in self.messages else None
+
+    def get(self, message_id):
+        message = self.messages[message_id]
+        if message["text"] is None:
+            (message["text"],) = self.db.execute("SELECT text FROM pages WHERE id = ?", (message_id,)).fetchone()
+            self.reloaded[message_id] = None
+            if len(self.reloaded) > RELOADED_MESSAGES:
+                # Still on disk, just drop the copy
+                self.messages[self.reloaded.popitem(last=False)[0]]["text"] = None
+        elif message_id in self.reloaded:
+            self.reloaded.move_to_end(message_id)
+        return message
+
+    def update(self, message_id, **fields):
+        message = self.get(message_id)
+        message.update(fields)
+        if "text" in fields:
+            text_metrics(message)
+        if "text" in fields and self.row(message_id) < self.paged_until:
+            # Late update (e.g. a long job finishing) of a message that is already paged out
+            self.page_file().execute("REPLACE INTO pages VALUES (?, ?)", (message_id, message["text"]))
+            self.db.commit()
+        return message
+
+    def trim(self):
+        cutoff = len(self.order) - self.resident
+        if cutoff <= self.paged_until:
+            return
+        db = self.page_file()
+        for message_id in self.order[self.paged_until:cutoff]:
+            message = self.messages[message_id]
+            db.execute("REPLACE INTO pages VALUES (?, ?)", (message_id, message["text"]))
+            message["text"] = None
+        db.commit()
+        self.paged_until = cutoff
+
+    def clear(self):
+        self.messages.clear()
+        self.order.clear()
+        self.reloaded.clear()
+        self.paged_until = 0
+        if self.db is not None:
+            self.db.close()
+            os.unlink(self.path)
+            self.db = None
+
+
+class TranscriptModel(QAbstractListModel):
+    """One row per chat message. Responses are created empty and filled in as their request progresses."""
+
+    MessageRole = Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = MessageStore()
+        self.actions = {}  # id -> (button label, callback)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store.order)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == self.MessageRole:
+            # Without reading paged out text back, "text" may be None
+            return self.store.messages[self.store.order[index.row()]]
+        if role == Qt.DisplayRole:
+            return self.message(index.row())["text"]
+        return None
+
+    def message(self, row):
+        """The message in row with its text, read back from the page file if needed."""
+        return self.store.get(self.store.order[row])
+
+    def add(self, role, text="", markdown=False):
+        row = len(self.store.order)
+        self.beginInsertRows(QModelIndex(), row, row)
+        message = {"role": role, "text": text, "markdown": markdown, "error": None, "image_path": None,
+                   "image_size": None, "owner": None, "version": 0}
+        if role == "assistant":
+            # Files the response produces belong to this message and are deleted along with it
+            message["owner"] = artifacts.new_entry()
+        message_id = self.store.append(message)
+        self.endInsertRows()
+        return message_id
+
+    def owner(self, message_id):
+        return self.store.messages[message_id]["owner"]
+
+    def update(self, message_id, **fields):
+        row = self.store.row(message_id)
+        if row is None:
+            return  # Cleared while its request was still running
+        message = self.store.update(message_id, **fields)
+        message["version"] += 1
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def refresh(self, message_id):
+        """Repaint a message whose content didn't change (e.g. its render finished)."""
+        row = self.store.row(message_id)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def set_action(self, message_id, label, callback):
+        if self.store.row(message_id) is None:
+            return
+        self.actions[message_id] = (label, callback)
+        self.update(message_id)
+
+    def clear(self):
+        self.beginResetModel()
+        for message in self.store.messages.values():
+            if message["owner"] is not None:
+                artifacts.release(message["owner"])
+        self.store.clear()
+        self.actions.clear()
+        self.endResetModel()
+
+
+class RenderCache:
+    """
+    LRU caches of what the delegate draws: laid out documents per message and diagram
+    thumbnails. Evicted thumbnails are decoded again off the GUI thread when scrolled back to.
+    """
+
+    def __init__(self, renderer, refresh, parent=None):
+        self.renderer = renderer
+        self.refresh = refresh  # Called with a message id once its markdown is rendered
+        self.font = bubble_font()
+        self.metrics = QFontMetrics(self.font)
+        self.documents = OrderedDict()  # message id -> (version, QTextDocument)
+        self.heights = {}  # message id -> (version, {width: height}), cheap enough to keep for every message
+        self.images = OrderedDict()  # image path -> QPixmap
+        self.loading = set()
+        self.rendering = {}  # message id -> newest text wanted while a render is in flight
+        # Own engine, so background rendering and decoding don't show the busy spinner
+        self.engine = RequestEngine(parent=parent)
+
+    def to_html(self, message):
+        """HTML of a message, None while its markdown is still being rendered in the background."""
+        if message["markdown"]:
+            body = self.renderer.cached(message["text"])
+            if body is None:
+                self.render_later(message["id"], message["text"])
+                return None
+        else:
+            align = "right" if message["role"] == "user" else "left"
+            text = html.escape(message["text"] or "...").replace("\n", "<br>")
+            body = f'<div align="{align}" style="color: white;">{text}</div>'
+        if message["error"]:
+            body += f'<p style="color: red;">Error: {html.escape(message["error"])}</p>'
+        return body
+
+    def render_later(self, message_id, text):
+        # One render per message in flight, a streamed reply only renders its newest text
+        if message_id in self.rendering:
+            self.rendering[message_id] = text
+            return
+        self.rendering[message_id] = text
+
+        def rendered(body):
+            self.heights.pop(message_id, None)  # Measured on the placeholder
+            latest = self.rendering.pop(message_id, None)
+            if latest is not None and latest != text:
+                self.render_later(message_id, latest)
+            self.refresh(message_id)
+
+        self.engine.submit(self.renderer.render, text, on_result=rendered,
+                           on_error=lambda error: self.rendering.pop(message_id, None))
+
+    def layout_document(self, message, width):
+        """
+        Laid out document of a message and whether it is current. While new markdown renders
+        the previous document stays on screen, or the plain text if there is none yet.
+        """
+        cached = self.documents.get(message["id"])
+        if cached is not None and cached[0] == message["version"]:
+            self.documents.move_to_end(message["id"])
+            document, fresh = cached[1], True
+        else:
+            body = self.to_html(message)
+            fresh = body is not None
+            if fresh or cached is None:
+                if body is None:
+                    body = f'<div style="color: white; white-space: pre-wrap;">{html.escape(message["text"])}</div>'
+                document = QTextDocument()
+                document.setDefaultFont(self.font)
+                document.setDocumentMargin(0)
+                document.setHtml(body)
+                # A placeholder is stored without a version so it is replaced once the render is done
+                self.documents[message["id"]] = (message["version"] if fresh else None, document)
+                if len(self.documents) > DOCUMENT_CACHE_SIZE:
+                    self.documents.popitem(last=False)
+            else:
+                document = cached[1]
+        if document.textWidth() != width:
+            document.setTextWidth(width)
+        return document, fresh
+
+    def document(self, message, width):
+        return self.layout_document(message, width)[0]
+
+    def known_height(self, message, width):
+        """Laid out text height at width if it was measured, None otherwise."""
+        cached = self.heights.get(message["id"])
+        if cached is not None and cached[0] == message["version"]:
+            return cached[1].get(width)
+        return None
+
+    def estimate_height(self, message, width):
+        """Text height guessed from the paragraph lengths, needs neither the text nor a layout."""
+        per_line = max(1, width // max(1, self.metrics.averageCharWidth()))
+        lines = sum(max(1, math.ceil(length / per_line)) for length in message["paragraphs"])
+        return lines * self.metrics.lineSpacing()
+
+    def text_height(self, message, width, exact=True):
+        """Laid out text height, or with exact=False the measured height if known and else an estimate."""
+        height = self.known_height(message, width)
+        if height is not None:
+            return height
+        if not exact:
+            return self.estimate_height(message, width)
+        document, _ = self.layout_document(message, width)
+        height = math.ceil(document.size().height())
+        cached = self.heights.get(message["id"])
+        widths = cached[1] if cached is not None and cached[0] == message["version"] else OrderedDict()
+        widths[width] = height
+        if len(widths) > HEIGHT_WIDTHS:
+            widths.popitem(last=False)
+        self.heights[message["id"]] = (message["version"], widths)
+        return height
+
+    def pixmap(self, path, on_ready):
+        pixmap = self.images.get(path)
+        if pixmap is not None:
+            self.images.move_to_end(path)
+            return pixmap
+        if path not in self.loading:
+            self.loading.add(path)
+
+            def loaded(image):
+                self.loading.discard(path)
+                self.put_image(path, image)
+                on_ready()
+
+            self.engine.submit(load_thumbnail, path, on_result=loaded,
+                               on_error=lambda message: self.loading.discard(path))
+        return None
+
+    def put_image(self, path, image):
+        self.images[path] = QPixmap.fromImage(image)
+        if len(self.images) > IMAGE_CACHE_SIZE:
+            self.images.popitem(last=False)
+
+    def clear(self):
+        self.engine.cancel_all()
+        self.documents.clear()
+        self.heights.clear()
+        self.images.clear()
+        self.loading.clear()
+        self.rendering.clear()
+
+
+class MessageDelegate(QStyledItemDelegate):
+    """Paints message bubbles straight from the model, no widget per message."""
+
+    def __init__(self, view):
+        super().__init__(view)
+        self.view = view
+        self.cache = view.cache
+
+    def parts(self, message, width, exact=True):
+        """
+        Rectangles of the bubble and its parts for a row of the given width, relative to the row.
+        exact=False doesn't lay out text that wasn't measured yet, its height is estimated.
+        """
+        left = MARGIN + PADDING
+        inner = max(width - 2 * left, 50)
+        y = MARGIN + PADDING
+        parts = {}
+        if message["length"] or message["error"] or not (message["image_path"] or message["id"] in self.view.model().actions):
+            height = self.cache.text_height(message, inner, exact)
+            parts["text"] = QRect(left, y, inner, height)
+            y += height + SPACING
+        if message["image_path"]:
+            image_width, image_height = message["image_size"]
+            if image_width > inner:
+                # Narrow window, shrink the thumbnail keeping its aspect ratio
+                image_width, image_height = inner, image_height * inner // image_width
+            parts["image"] = QRect(left + (inner - image_width) // 2, y, image_width, image_height)
+            y += image_height + SPACING
+        action = self.view.model().actions.get(message["id"])
+        if action:
+            label_width = QFontMetrics(self.cache.font).horizontalAdvance(action[0])
+            parts["button"] = QRect(left, y, label_width + 40, BUTTON_HEIGHT)
+            y += BUTTON_HEIGHT + SPACING
+        parts["bubble"] = QRect(MARGIN, MARGIN, width - 2 * MARGIN, y - SPACING + PADDING - MARGIN)
+        return parts
+
+    def row_height(self, parts):
+        return parts["bubble"].bottom() + 1 + MARGIN
+
+    def sizeHint(self, option, index):
+        # Called for every row on each relayout, so no text is paged in or laid out here
+        message = index.data(TranscriptModel.MessageRole)
+        width = self.view.viewport().width()
+        return QSize(width, self.row_height(self.parts(message, width, exact=False)))
+
+    def paint(self, painter, option, index):
+        # Only rows in the viewport are painted, they get their text and a real layout
+        message = self.view.model().message(index.row())
+        parts = self.parts(message, option.rect.width())
+        if self.row_height(parts) != option.rect.height():
+            self.view.resize_later(message["id"])  # Laid out with an estimate
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.translate(option.rect.topLeft())
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(BUBBLE_COLORS[message["role"]]))
+        painter.drawRoundedRect(parts["bubble"], 25, 25)
+
+        if "text" in parts:
+            painter.save()
+            painter.translate(parts["text"].topLeft())
+            self.cache.document(message, parts["text"].width()).drawContents(painter)
+            painter.restore()
+
+        if "image" in parts:
+            message_id = message["id"]
+            pixmap = self.cache.pixmap(message["image_path"], lambda: self.view.model().refresh(message_id))
+            painter.setBrush(QColor(IMAGE_BACKGROUND))
+            painter.drawRoundedRect(parts["image"], 10, 10)
+            if pixmap is not None:
+                painter.drawPixmap(parts["image"], pixmap)
+
+        if "button" in parts:
+            painter.setBrush(QColor(BUTTON_COLOR))
+            painter.drawRoundedRect(parts["button"], 10, 10)
+            painter.setPen(QColor("white"))
+            painter.setFont(self.cache.font)
+            painter.drawText(parts["button"], Qt.AlignCenter, self.view.model().actions[message["id"]][0])
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() != QEvent.MouseButtonRelease or event.button() != Qt.LeftButton:
+            return False
+        message = model.message(index.row())
+        parts = self.parts(message, option.rect.width())
+        position = event.pos() - option.rect.topLeft()
+        if "button" in parts and parts["button"].contains(position):
+            model.actions[message["id"]][1]()
+            return True
+        if "image" in parts and parts["image"].contains(position):
+            # Full resolution is only loaded while the zoom dialog is open
+            ZoomDialog(message["image_path"], self.view.window()).show()
+            return True
+        return False
+
+
+class TranscriptView(QListView):
+    """
+    Chat transcript as a model/view list: only visible messages are laid out and painted,
+    the rest are sized from estimates. Rendered documents and images sit in LRU caches and
+    old message text is paged out to disk.
+    """
+
+    def __init__(self, renderer, parent=None):
+        super().__init__(parent)
+        self.cache = RenderCache(renderer, lambda message_id: self.model().refresh(message_id), parent=self)
+        self.setModel(TranscriptModel(self))
+        self.setItemDelegate(MessageDelegate(self))
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.setResizeMode(QListView.Adjust)  # Re-wrap messages when the window width changes
+        self.setLayoutMode(QListView.Batched)  # Long transcripts are laid out a batch at a time
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setSpacing(0)
+        self.resizing = set()  # Message ids whose painted height differs from their size hint
+        self.model().rowsInserted.connect(self.follow)
+        self.model().dataChanged.connect(self.message_changed)
+
+    def at_bottom(self):
+        scroll_bar = self.verticalScrollBar()
+        return scroll_bar.value() >= scroll_bar.maximum() - 5
+
+    def follow(self):
+        # Keep the newest message in view unless the user scrolled up
+        if self.at_bottom():
+            QTimer.singleShot(0, self.scrollToBottom)
+
+    def message_changed(self, top_left, bottom_right):
+        # The message may have grown, have its row laid out again
+        self.itemDelegate().sizeHintChanged.emit(top_left)
+        self.follow()
+
+    def resize_later(self, message_id):
+        # Not from inside paint, relayout once the current paint is done
+        if not self.resizing:
+            QTimer.singleShot(0, self.resize_rows)
+        self.resizing.add(message_id)
+
+    def resize_rows(self):
+        bottom = self.at_bottom()
+        for message_id in self.resizing:
+            row = self.model().store.row(message_id)
+            if row is not None:
+                self.itemDelegate().sizeHintChanged.emit(self.model().index(row))
+        self.resizing.clear()
+        if bottom:
+            QTimer.singleShot(0, self.scrollToBottom)
+
+    def clear(self):
+        self.resizing.clear()
+        self.cache.clear()
+        self.model().clear()